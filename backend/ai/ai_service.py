@@ -1,25 +1,112 @@
 """
 AI service for content generation using Gemini API
+
+All model calls go through the configured backend (see ai/backends.py) and
+its async client, so an in-flight generation waits on the event loop
+instead of holding a worker thread.
 """
-import google.generativeai as genai
-from typing import List, Dict, Optional
-from config import GEMINI_API_KEY
+import asyncio
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
+from config import (
+    GENERATION_MODE,
+    GENERATION_CONCURRENCY,
+    GENERATION_CONTEXT,
+    GENERATION_CONTEXT_TOKENS,
+    REFINE_BATCH_CONCURRENCY,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_DB_PATH
+)
+from ai.backends import LLMBackend, create_backend
+from ai.cache import ResponseCache
+from ai.context import RollingContext, count_tokens, outline_window, truncate_tokens
+from ai.resilience import ResilientCaller
+from ai.scheduler import llm_scheduler
+from services.metrics import llm_prompt_tokens, track_llm_call
+from services.single_flight import SingleFlight
+
+# Bump whenever a prompt template changes so cached responses are not reused
+PROMPT_VERSION = "1"
 
 
 class AIService:
     """Service for AI-powered content generation"""
     
-    def __init__(self):
-        """Initialize the AI service"""
-        if GEMINI_API_KEY:
-            genai.configure(api_key=GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-            self.enabled = True
-        else:
-            self.model = None
-            self.enabled = False
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        """
+        Initialize the AI service
+        
+        Args:
+            backend: Model backend (defaults to the one LLM_BACKEND selects)
+        """
+        self.backend = backend or create_backend()
+        self.enabled = self.backend is not None
+        self.resilience = ResilientCaller()
+        # Identical cacheable prompts in flight at once share one model call
+        self.in_flight = SingleFlight("model_call")
+        
+        self.cache = None
+        if LLM_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                max_entries=LLM_CACHE_MAX_ENTRIES,
+                ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                db_path=LLM_CACHE_DB_PATH
+            )
+    
+    async def _generate(self, prompt: str, operation: str, cached: bool = True) -> str:
+        """
+        Call the model for a prompt, going through the response cache
+        
+        Cacheable prompts that are already being sent (e.g. two outline
+        suggestions for the same topic) wait for that call instead of
+        making their own.
+        
+        Args:
+            prompt: The fully rendered prompt
+            operation: Metrics label for the call ("outline", "section", "refine", "summary")
+            cached: Whether the response may be served from / stored in the cache
+        
+        Returns:
+            The stripped response text
+        """
+        if not cached:
+            return (await self._call_model(prompt, operation)).strip()
+        
+        key = ResponseCache.make_key(self.backend.model_name, PROMPT_VERSION, prompt)
+        if self.cache is not None:
+            text = await self.cache.get(key)
+            if text is not None:
+                return text
+        
+        async def call() -> str:
+            text = (await self._call_model(prompt, operation)).strip()
+            if self.cache is not None:
+                await self.cache.set(key, text)
+            return text
+        
+        return await self.in_flight.run(key, call)
     
-    def suggest_outline(self, topic: str, doc_type: str) -> List[str]:
+    async def _call_model(self, prompt: str, operation: str) -> str:
+        """
+        Call the backend, retrying transient failures
+        
+        Each attempt waits for its turn in the scheduler first.
+        
+        Raises:
+            ModelUnavailable: If the call failed for good
+        """
+        llm_prompt_tokens.labels(operation).observe(count_tokens(prompt))
+        
+        async def attempt() -> str:
+            with track_llm_call(operation):
+                return await self.backend.generate(prompt)
+        
+        return await self.resilience.call(
+            operation, attempt, lambda: llm_scheduler.slot(operation, prompt)
+        )
+    
+    async def suggest_outline(self, topic: str, doc_type: str) -> List[str]:
         """
         Suggest an outline for a document based on topic
         
@@ -29,6 +116,9 @@ class AIService:
         
         Returns:
             List of section titles or slide titles
+        
+        Raises:
+            ModelUnavailable: If the model could not be reached
         """
         if not self.enabled:
             # Return placeholder outline if API key not configured
@@ -49,42 +139,22 @@ class AIService:
                     "Conclusion"
                 ]
         
-        try:
-            if doc_type == "docx":
-                prompt = f"""Generate a structured outline for a professional document about: {topic}
+        if doc_type == "docx":
+            prompt = f"""Generate a structured outline for a professional document about: {topic}
 
 Provide 5-7 section titles that would make a comprehensive document.
 Return only the section titles, one per line, without numbering or bullets."""
-            else:
-                prompt = f"""Generate a structured outline for a professional PowerPoint presentation about: {topic}
+        else:
+            prompt = f"""Generate a structured outline for a professional PowerPoint presentation about: {topic}
 
 Provide 5-8 slide titles that would make a comprehensive presentation.
 Return only the slide titles, one per line, without numbering or bullets."""
-            
-            response = self.model.generate_content(prompt)
-            sections = [line.strip() for line in response.text.strip().split('\n') if line.strip()]
-            return sections
-        except Exception as e:
-            print(f"Error generating outline: {e}")
-            # Return default outline on error
-            if doc_type == "docx":
-                return [
-                    "Introduction",
-                    "Background",
-                    "Main Content",
-                    "Analysis",
-                    "Conclusion"
-                ]
-            else:
-                return [
-                    "Title Slide",
-                    "Introduction",
-                    "Key Points",
-                    "Analysis",
-                    "Conclusion"
-                ]
+        
+        text = await self._generate(prompt, "outline")
+        sections = [line.strip() for line in text.split('\n') if line.strip()]
+        return sections
     
-    def generate_section_content(
+    async def generate_section_content(
         self, 
         topic: str, 
         section_title: str, 
@@ -102,13 +172,71 @@ Return only the slide titles, one per line, without numbering or bullets."""
         
         Returns:
             Generated content as string
+        
+        Raises:
+            ModelUnavailable: If the model could not be reached
         """
         if not self.enabled:
-            return f"[Placeholder content for '{section_title}']\n\nThis is sample content that would be generated by the AI. Configure your GEMINI_API_KEY in the .env file to enable actual AI generation.\n\nTopic: {topic}"
+            return self._placeholder_content(topic, section_title)
         
-        try:
-            if doc_type == "docx":
-                prompt = f"""Write detailed content for a document section.
+        prompt = self._section_prompt(topic, section_title, doc_type, context)
+        # Regenerating a section should produce fresh content, so skip the cache
+        return await self._generate(prompt, "section", cached=False)
+    
+    async def stream_section_content(
+        self,
+        topic: str,
+        section_title: str,
+        doc_type: str,
+        context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generate content for a section, yielding text chunks as the model produces them
+        
+        Args:
+            topic: The overall document topic
+            section_title: The title of this section/slide
+            doc_type: Either "docx" or "pptx"
+            context: Optional context from previous sections
+        
+        Returns:
+            Iterator of text chunks
+        
+        Raises:
+            ModelUnavailable: If the model could not be reached or the stream broke off
+        """
+        if not self.enabled:
+            yield self._placeholder_content(topic, section_title)
+            return
+        
+        prompt = self._section_prompt(topic, section_title, doc_type, context)
+        llm_prompt_tokens.labels("section").observe(count_tokens(prompt))
+        
+        async def open_stream() -> AsyncIterator[str]:
+            with track_llm_call("section"):
+                async for chunk in self.backend.stream(prompt):
+                    yield chunk
+        
+        async for chunk in self.resilience.stream(
+            "section", open_stream, lambda: llm_scheduler.slot("section", prompt)
+        ):
+            yield chunk
+    
+    @staticmethod
+    def _placeholder_content(topic: str, section_title: str) -> str:
+        """Placeholder section content used when the API key is not configured"""
+        return f"[Placeholder content for '{section_title}']\n\nThis is sample content that would be generated by the AI. Configure your GEMINI_API_KEY in the .env file to enable actual AI generation.\n\nTopic: {topic}"
+    
+    @staticmethod
+    def _section_prompt(
+        topic: str,
+        section_title: str,
+        doc_type: str,
+        context: Optional[str] = None
+    ) -> str:
+        """Build the prompt for generating a section or slide"""
+        if doc_type == "docx":
+            return f"""Write detailed content for a document section.
 
 Document Topic: {topic}
 Section Title: {section_title}
@@ -116,8 +244,8 @@ Section Title: {section_title}
 
 Write 2-3 paragraphs of professional, informative content for this section. Make it detailed and relevant to the topic.
 IMPORTANT: Do not include the section title in the output. Do not use markdown bolding (**) or headings (##)."""
-            else:
-                prompt = f"""Write content for a PowerPoint slide.
+        
+        return f"""Write content for a PowerPoint slide.
 
 Presentation Topic: {topic}
 Slide Title: {section_title}
@@ -125,14 +253,8 @@ Slide Title: {section_title}
 
 Provide 3-5 bullet points of concise, impactful content for this slide. Each bullet should be clear and professional.
 IMPORTANT: Do not include the slide title in the output. Do not use markdown bolding (**) or headings (##). Use standard bullet points (• or -)."""
-            
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f"Error generating content: {e}")
-            return f"Error generating content: {str(e)}"
     
-    def refine_content(
+    async def refine_content(
         self, 
         original_content: str, 
         refinement_prompt: str,
@@ -148,12 +270,14 @@ IMPORTANT: Do not include the slide title in the output. Do not use markdown bol
         
         Returns:
             Refined content
+        
+        Raises:
+            ModelUnavailable: If the model could not be reached
         """
         if not self.enabled:
             return f"{original_content}\n\n[Refinement applied: {refinement_prompt}]"
         
-        try:
-            prompt = f"""Refine the following content based on the user's instructions.
+        prompt = f"""Refine the following content based on the user's instructions.
 
 Section Title: {section_title}
 Current Content:
@@ -163,13 +287,245 @@ User Instructions: {refinement_prompt}
 
 Provide the refined content, maintaining the same format and style but incorporating the requested changes.
 IMPORTANT: Do not include the section title in the output. Do not use markdown bolding (**) or headings (##)."""
-            
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f"Error refining content: {e}")
-            return original_content
+        
+        return await self._generate(prompt, "refine")
+    
+    async def refine_sections(
+        self,
+        sections: List[Tuple[str, str]],
+        refinement_prompt: str,
+        concurrency: Optional[int] = None
+    ) -> List[str]:
+        """
+        Apply one refinement instruction to several sections concurrently
+        
+        Args:
+            sections: (title, content) of each section to refine
+            refinement_prompt: User's refinement instructions
+            concurrency: Maximum refinements in flight (defaults to REFINE_BATCH_CONCURRENCY)
+        
+        Returns:
+            Refined content, in the order of sections
+        
+        Raises:
+            ModelUnavailable: If any refinement failed (the others are cancelled)
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or REFINE_BATCH_CONCURRENCY))
+        
+        async def refine(section_title: str, content: str) -> str:
+            async with semaphore:
+                return await self.refine_content(content, refinement_prompt, section_title)
+        
+        tasks = [asyncio.create_task(refine(title, content)) for title, content in sections]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def summarize_outline(self, topic: str, outline: List[str], doc_type: str) -> str:
+        """
+        Write a short summary of the whole document to share between sections
+        
+        Args:
+            topic: The overall document topic
+            outline: List of section/slide titles
+            doc_type: Either "docx" or "pptx"
+        
+        Returns:
+            Summary text (the outline context when the API key is not configured)
+        
+        Raises:
+            ModelUnavailable: If the model could not be reached
+        """
+        outline_context = self.build_outline_context(outline)
+        if not self.enabled:
+            return outline_context
+        
+        kind = "document" if doc_type == "docx" else "presentation"
+        prompt = f"""Write a short summary (3-4 sentences) of a {kind} about: {topic}
+
+The {kind} has the following sections:
+{outline_context}
 
+Describe the overall narrative and what each part should cover so that sections written independently stay consistent.
+IMPORTANT: Do not use markdown bolding (**) or headings (##)."""
+        
+        return await self._generate(prompt, "summary")
+    
+    @staticmethod
+    def build_outline_context(outline: List[str], index: Optional[int] = None) -> str:
+        """
+        Build section context from the outline titles alone
+        
+        Args:
+            outline: List of section/slide titles
+            index: Optional position of the section being written
+        
+        Returns:
+            Numbered outline, with the current section marked when index is given
+        """
+        lines = []
+        for i, title in enumerate(outline):
+            marker = " (this section)" if i == index else ""
+            lines.append(f"{i + 1}. {title}{marker}")
+        return "\n".join(lines)
+    
+    async def generate_sections(
+        self,
+        topic: str,
+        outline: List[str],
+        doc_type: str,
+        mode: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Generate content for every section/slide in an outline
+        
+        Args:
+            topic: The overall document topic
+            outline: List of section/slide titles
+            doc_type: Either "docx" or "pptx"
+            mode: "concurrent" or "sequential" (defaults to GENERATION_MODE)
+            concurrency: Maximum sections in flight (defaults to GENERATION_CONCURRENCY)
+        
+        Returns:
+            List of dicts with 'title', 'content' and 'index' keys, in outline order
+        """
+        sections = [
+            event["section"]
+            async for event in self.iter_sections(topic, outline, doc_type, mode, concurrency)
+            if event["event"] == "section"
+        ]
+        return sorted(sections, key=lambda section: section["index"])
+    
+    async def iter_sections(
+        self,
+        topic: str,
+        outline: List[str],
+        doc_type: str,
+        mode: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        stream_tokens: bool = False,
+        completed: Optional[Dict[int, str]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Generate every section/slide in an outline, yielding events as they happen
+        
+        In "sequential" mode each section is written after the previous one
+        and receives excerpts of the latest sections plus a running summary
+        of older ones as context. In "concurrent" mode sections are written
+        at the same time by up to `concurrency` workers, sharing context
+        built from the outline (or a first-pass summary), so the total time
+        follows the slowest section rather than the sum. Either way the
+        context stays within GENERATION_CONTEXT_TOKENS, so per-section cost
+        does not grow with the length of the outline.
+        
+        Args:
+            topic: The overall document topic
+            outline: List of section/slide titles
+            doc_type: Either "docx" or "pptx"
+            mode: "concurrent" or "sequential" (defaults to GENERATION_MODE)
+            concurrency: Maximum sections in flight (defaults to GENERATION_CONCURRENCY)
+            stream_tokens: Also yield text chunks while each section is written
+            completed: Content of sections that are already written, by index;
+                they are not regenerated but still feed sequential context
+        
+        Returns:
+            Iterator of {"event": "token", "index", "text"} and
+            {"event": "section", "section"} dicts, in completion order
+        """
+        mode = mode or GENERATION_MODE
+        completed = completed or {}
+        pending = [i for i in range(len(outline)) if i not in completed]
+        events = asyncio.Queue()
+        
+        async def write(i: int, context: Optional[str]) -> str:
+            on_token = None
+            if stream_tokens:
+                on_token = lambda text: events.put_nowait({"event": "token", "index": i, "text": text})
+            content = await self._write_section(topic, outline[i], doc_type, context, on_token)
+            events.put_nowait({
+                "event": "section",
+                "section": {"title": outline[i], "content": content, "index": i}
+            })
+            return content
+        
+        if mode == "sequential":
+            async def write_all():
+                context = RollingContext()
+                for i, section_title in enumerate(outline):
+                    if i in completed:
+                        content = completed[i]
+                    else:
+                        content = await write(i, context.render())
+                    # Build context for next section
+                    context.add(section_title, content)
+            
+            jobs = [write_all()]
+        else:
+            summary = None
+            if GENERATION_CONTEXT == "summary" and pending:
+                # Up to half the budget for the summary, the rest for the outline
+                summary = truncate_tokens(
+                    await self.summarize_outline(topic, outline, doc_type),
+                    GENERATION_CONTEXT_TOKENS // 2
+                )
+            outline_budget = GENERATION_CONTEXT_TOKENS - (count_tokens(summary) if summary else 0)
+            
+            def section_context(i: int) -> str:
+                context = outline_window(outline, i, outline_budget)
+                if summary:
+                    context = f"{summary}\n\nOutline:\n{context}"
+                return context
+            
+            semaphore = asyncio.Semaphore(max(1, concurrency or GENERATION_CONCURRENCY))
+            
+            async def write_bounded(i: int):
+                async with semaphore:
+                    await write(i, section_context(i))
+            
+            jobs = [write_bounded(i) for i in pending]
+        
+        def report_failure(task: asyncio.Task):
+            if not task.cancelled() and task.exception() is not None:
+                events.put_nowait({"event": "failed", "error": task.exception()})
+        
+        tasks = [asyncio.create_task(job) for job in jobs]
+        for task in tasks:
+            task.add_done_callback(report_failure)
+        
+        try:
+            remaining = len(pending)
+            while remaining:
+                event = await events.get()
+                if event["event"] == "failed":
+                    raise event["error"]
+                if event["event"] == "section":
+                    remaining -= 1
+                yield event
+        finally:
+            # Stop unfinished sections if the consumer goes away early
+            for task in tasks:
+                task.cancel()
+    
+    async def _write_section(
+        self,
+        topic: str,
+        section_title: str,
+        doc_type: str,
+        context: Optional[str],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Generate one section, streaming chunks to on_token when given"""
+        if on_token is None:
+            return await self.generate_section_content(topic, section_title, doc_type, context)
+        
+        chunks = []
+        async for chunk in self.stream_section_content(topic, section_title, doc_type, context):
+            chunks.append(chunk)
+            on_token(chunk)
+        return "".join(chunks).strip()
 
 # Global AI service instance
 ai_service = AIService()
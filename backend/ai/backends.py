@@ -0,0 +1,210 @@
+"""
+Model backends for the AI service
+
+AIService talks to the model only through LLMBackend, so the provider can be
+swapped by configuration. GeminiBackend calls the Gemini API; FakeBackend is
+a deterministic local stand-in with configurable latency, streaming pace and
+error rate, for load tests and benchmarks that must not use the network or
+API quota.
+"""
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import random
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Optional
+
+import google.generativeai as genai
+
+from config import (
+    LLM_BACKEND,
+    GEMINI_API_KEY,
+    FAKE_LLM_LATENCY_MS,
+    FAKE_LLM_JITTER_MS,
+    FAKE_LLM_CHUNK_DELAY_MS,
+    FAKE_LLM_ERROR_RATE,
+    FAKE_LLM_SEED
+)
+
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Vocabulary the fake backend builds its responses from
+FAKE_WORDS = (
+    "market growth strategy customer revenue product platform team risk "
+    "analysis quarter pipeline adoption pricing retention margin roadmap "
+    "partner channel forecast insight operations quality delivery scale"
+).split()
+
+
+class LLMError(Exception):
+    """Raised by a backend when a model call fails"""
+
+
+class LLMBackend(ABC):
+    """Interface every model backend implements"""
+
+    # Identifies the model in response cache keys
+    model_name = ""
+
+    @abstractmethod
+    async def generate(self, prompt: str) -> str:
+        """
+        Generate a complete response
+
+        Args:
+            prompt: The fully rendered prompt
+
+        Returns:
+            Response text
+        """
+
+    @abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Generate a response, yielding text chunks as they are produced
+
+        Args:
+            prompt: The fully rendered prompt
+
+        Returns:
+            Iterator of text chunks
+        """
+
+
+class GeminiBackend(LLMBackend):
+    """Gemini API through the async google-generativeai client"""
+
+    def __init__(self, api_key: str = GEMINI_API_KEY, model_name: str = MODEL_NAME):
+        """
+        Initialize the backend
+
+        Args:
+            api_key: Gemini API key
+            model_name: Gemini model to call
+        """
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic local model for load tests
+
+    The response text depends only on the seed and the prompt. Latency,
+    jitter and failures are drawn from a generator seeded with the seed, the
+    prompt and how many times that prompt was sent before, so a run replays
+    the same way regardless of scheduling order, and a retried prompt gets a
+    fresh draw instead of failing forever.
+    """
+
+    model_name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: float = FAKE_LLM_LATENCY_MS,
+        jitter_ms: float = FAKE_LLM_JITTER_MS,
+        chunk_delay_ms: float = FAKE_LLM_CHUNK_DELAY_MS,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        seed: int = FAKE_LLM_SEED,
+        lines: int = 5,
+        words_per_line: int = 12
+    ):
+        """
+        Initialize the backend
+
+        Args:
+            latency_ms: Time before the response (or the first chunk)
+            jitter_ms: Extra latency drawn uniformly from [0, jitter_ms]
+            chunk_delay_ms: Delay between streamed chunks
+            error_rate: Fraction of calls that raise LLMError
+            seed: Seed for response text, jitter and failures
+            lines: Lines per response (outline prompts read them as titles)
+            words_per_line: Words per line
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.lines = lines
+        self.words_per_line = words_per_line
+        self.calls = 0
+        self._attempts: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    async def generate(self, prompt: str) -> str:
+        rng = self._call_rng(prompt)
+        await asyncio.sleep(self._latency(rng))
+        self._maybe_fail(rng)
+        return self.response_text(prompt)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        rng = self._call_rng(prompt)
+        await asyncio.sleep(self._latency(rng))
+        self._maybe_fail(rng)
+        for i, line in enumerate(self.response_text(prompt).split("\n")):
+            if i:
+                await asyncio.sleep(self.chunk_delay_ms / 1000)
+            yield line + "\n"
+
+    def response_text(self, prompt: str) -> str:
+        """The response the backend gives for a prompt"""
+        rng = random.Random(self._digest(prompt))
+        return "\n".join(
+            " ".join(rng.choice(FAKE_WORDS) for _ in range(self.words_per_line)).capitalize() + "."
+            for _ in range(self.lines)
+        )
+
+    def _call_rng(self, prompt: str) -> random.Random:
+        """Generator for one call's latency and failure draws"""
+        with self._lock:
+            attempt = self._attempts[prompt]
+            self._attempts[prompt] += 1
+            self.calls += 1
+        return random.Random(self._digest(f"{attempt}\0{prompt}"))
+
+    def _digest(self, text: str) -> int:
+        """Stable integer seed for a text (hash() is salted per process)"""
+        digest = hashlib.sha256(f"{self.seed}\0{text}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def _latency(self, rng: random.Random) -> float:
+        """Latency of one call in seconds"""
+        return (self.latency_ms + rng.uniform(0, self.jitter_ms)) / 1000
+
+    def _maybe_fail(self, rng: random.Random):
+        """Raise LLMError for the configured fraction of calls"""
+        if rng.random() < self.error_rate:
+            raise LLMError("Simulated model failure")
+
+
+def create_backend(name: str = LLM_BACKEND) -> Optional[LLMBackend]:
+    """
+    Build the configured backend
+
+    Args:
+        name: "gemini" or "fake"
+
+    Returns:
+        The backend, or None when Gemini is selected without an API key
+        (the AI service then returns placeholder content)
+    """
+    if name == "fake":
+        return FakeBackend()
+    if name != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND: {name}")
+    if not GEMINI_API_KEY:
+        return None
+    return GeminiBackend()
@@ -0,0 +1,149 @@
+"""
+Content-addressed cache for model responses
+
+Responses are keyed by a hash of the model name, the prompt template version
+and the rendered prompt. Lookups go to an in-process LRU tier first and then
+to an optional SQLite tier that every gunicorn worker on the host can share.
+The SQLite tier runs in a thread, so a locked database file never stalls
+the event loop.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from services.metrics import record_cache_lookup
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional SQLite) cache for model responses"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 3600, db_path: str = ""):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum entries kept in the memory tier
+            ttl_seconds: Time-to-live of an entry in both tiers
+            db_path: SQLite file for the shared tier (disabled when empty)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    @staticmethod
+    def make_key(model_name: str, prompt_version: str, prompt: str) -> str:
+        """Hash the model, template version and rendered prompt into a cache key"""
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_version, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    record_cache_lookup("llm", "hit")
+                    return value
+                del self._entries[key]
+
+        if self.db_path:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self.disk_hits += 1
+                record_cache_lookup("llm", "disk_hit")
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        record_cache_lookup("llm", "miss")
+        return None
+
+    async def set(self, key: str, value: str):
+        """Store a response in every tier"""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            self._writes += 1
+            purge = self._writes % 100 == 0
+
+        if self.db_path:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at, purge)
+
+    def clear(self):
+        """Drop every entry from the memory tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for the cache"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        """Look a key up in the shared SQLite tier"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+
+    def _disk_set(self, key: str, value: str, expires_at: float, purge: bool):
+        """Write an entry to the shared SQLite tier, dropping expired ones when purge is set"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            if purge:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def _store(self, key: str, value: str, expires_at: float):
+        """Insert into the memory tier, evicting the least recently used entries"""
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the shared SQLite tier"""
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,150 @@
+"""
+Token-budgeted context for section prompts
+
+Sequential generation used to pass every earlier section to the next one,
+so prompts grew with each section and a long outline cost quadratically
+more than a short one. RollingContext keeps the last few sections as
+excerpts and folds older ones into a compact running summary (one short
+line each, the oldest dropped first), all within a fixed token budget.
+outline_window does the same for the outline titles that concurrent
+generation shares between sections.
+
+Token counts are estimates (about four characters per token); they only
+need to be stable, not exact.
+"""
+import re
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from config import GENERATION_CONTEXT_TOKENS, GENERATION_CONTEXT_WINDOW
+
+# Tokens kept from each section in the recent window (~200 characters)
+EXCERPT_TOKENS = 50
+# Tokens kept from each section folded into the running summary
+SUMMARY_LINE_TOKENS = 24
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text: str) -> int:
+    """Estimated token count of a text"""
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    """Cut a text to about `tokens` tokens, marking the cut with an ellipsis"""
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "..."
+
+
+class RollingContext:
+    """Bounded context of the sections written so far"""
+
+    def __init__(self, budget_tokens: int = GENERATION_CONTEXT_TOKENS, window: int = GENERATION_CONTEXT_WINDOW):
+        """
+        Initialize the context
+
+        Args:
+            budget_tokens: Most tokens render() returns
+            window: Latest sections kept as excerpts; older ones are summarized
+        """
+        self.budget_tokens = budget_tokens
+        self.window: Deque[Tuple[str, str]] = deque()
+        self.window_size = max(1, window)
+        self.summary: Deque[str] = deque()
+        self.omitted = 0
+
+    def add(self, title: str, content: str):
+        """
+        Record a finished section
+
+        Args:
+            title: Section title
+            content: Section content
+        """
+        self.window.append((title, truncate_tokens(" ".join(content.split()), EXCERPT_TOKENS)))
+        if len(self.window) > self.window_size:
+            older_title, older_excerpt = self.window.popleft()
+            self.summary.append(f"{older_title}: {truncate_tokens(self._first_sentence(older_excerpt), SUMMARY_LINE_TOKENS)}")
+        self._fit()
+
+    def render(self) -> Optional[str]:
+        """The context for the next section, or None before the first one"""
+        if not self.window:
+            return None
+        parts: List[str] = []
+        if self.omitted:
+            parts.append(f"({self.omitted} earlier sections not shown)")
+        if self.summary:
+            parts.append("Earlier sections:")
+            parts.extend(f"- {line}" for line in self.summary)
+        parts.append("Latest sections:")
+        parts.extend(f"{title}: {excerpt}" for title, excerpt in self.window)
+        return "\n".join(parts)
+
+    def tokens(self) -> int:
+        """Estimated size of render()"""
+        context = self.render()
+        return count_tokens(context) if context else 0
+
+    def _fit(self):
+        """Drop the oldest summary lines, then the oldest excerpts, until within budget"""
+        while self.tokens() > self.budget_tokens and (self.summary or len(self.window) > 1):
+            if self.summary:
+                self.summary.popleft()
+            else:
+                self.window.popleft()
+            self.omitted += 1
+
+    @staticmethod
+    def _first_sentence(text: str) -> str:
+        """First sentence of a text (the whole text if it has one sentence)"""
+        return _SENTENCE_END.split(text, 1)[0]
+
+
+def outline_window(outline: List[str], index: int, budget_tokens: int = GENERATION_CONTEXT_TOKENS) -> str:
+    """
+    Numbered outline around one section, within a token budget
+
+    Titles nearest the current section are kept first; gaps are shown as
+    "..." so the model still knows where the section sits.
+
+    Args:
+        outline: List of section/slide titles
+        index: Position of the section being written
+        budget_tokens: Most tokens to return
+
+    Returns:
+        Numbered outline with the current section marked
+    """
+    def line(i: int) -> str:
+        marker = " (this section)" if i == index else ""
+        return f"{i + 1}. {outline[i]}{marker}"
+
+    kept = {index}
+    used = count_tokens(line(index))
+    for distance in range(1, len(outline)):
+        added = False
+        for i in (index - distance, index + distance):
+            if 0 <= i < len(outline):
+                cost = count_tokens(line(i)) + 1
+                if used + cost > budget_tokens:
+                    continue
+                kept.add(i)
+                used += cost
+                added = True
+        if not added:
+            break
+
+    lines = []
+    previous = -1
+    for i in sorted(kept):
+        if i > previous + 1:
+            lines.append("...")
+        lines.append(line(i))
+        previous = i
+    if previous < len(outline) - 1:
+        lines.append("...")
+    return "\n".join(lines)
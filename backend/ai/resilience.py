@@ -0,0 +1,349 @@
+"""
+Retries, deadlines, hedging and a circuit breaker for model calls
+
+A call is made of attempts. Each attempt waits for its turn in the
+scheduler and then has LLM_ATTEMPT_TIMEOUT_SECONDS to answer. Transient
+failures (rate limiting, 5xx, timeouts, dropped connections) are retried
+with capped, fully jittered exponential backoff until the attempts or the
+call's LLM_CALL_DEADLINE_SECONDS run out; other errors fail at once.
+
+With hedging on, an attempt that is still running after the operation's
+recent p95 latency gets a duplicate, and whichever answers first wins.
+
+The circuit breaker counts consecutive transient failures. Past the
+threshold it opens and calls fail immediately with ModelUnavailable
+instead of queueing up behind a dead upstream; after the reset period one
+probe call is let through to test it.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import AbstractAsyncContextManager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from ai.backends import LLMError
+from config import (
+    LLM_RETRY_ATTEMPTS,
+    LLM_RETRY_BASE_DELAY_MS,
+    LLM_RETRY_MAX_DELAY_MS,
+    LLM_ATTEMPT_TIMEOUT_SECONDS,
+    LLM_CALL_DEADLINE_SECONDS,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY_MS,
+    LLM_BREAKER_FAILURE_THRESHOLD,
+    LLM_BREAKER_RESET_SECONDS
+)
+from services.metrics import llm_circuit_open, llm_hedged_requests, llm_retries
+
+# Errors worth another attempt: the request was fine, the upstream was not
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    LLMError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted
+)
+
+# Successful calls an operation needs before hedging uses its p95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+
+
+class ModelUnavailable(Exception):
+    """Raised when a model call failed for good (or the circuit is open)"""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        """
+        Initialize the error
+
+        Args:
+            message: What went wrong
+            retry_after: Seconds after which a new call may succeed
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed"""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        """
+        Initialize the breaker
+
+        Args:
+            failure_threshold: Consecutive transient failures that open it (0 disables it)
+            reset_seconds: How long it stays open before a probe call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; claims the probe when half-open"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def retry_after(self) -> int:
+        """Seconds until the breaker lets a probe through"""
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1)
+
+    def record_success(self):
+        """The upstream answered; close the breaker"""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+        llm_circuit_open.set(0)
+
+    def release_probe(self):
+        """The probe ended without an answer (e.g. it was cancelled); let another through"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        """A transient failure; open (or reopen) the breaker past the threshold"""
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.failure_threshold > 0 and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._probing = False
+                opened = True
+            else:
+                opened = False
+        if opened:
+            llm_circuit_open.set(1)
+
+
+class ResilientCaller:
+    """Runs model calls with retries, deadlines, hedging and a circuit breaker"""
+
+    def __init__(
+        self,
+        attempts: int = LLM_RETRY_ATTEMPTS,
+        base_delay_ms: float = LLM_RETRY_BASE_DELAY_MS,
+        max_delay_ms: float = LLM_RETRY_MAX_DELAY_MS,
+        attempt_timeout: float = LLM_ATTEMPT_TIMEOUT_SECONDS,
+        deadline: float = LLM_CALL_DEADLINE_SECONDS,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_min_delay_ms: float = LLM_HEDGE_MIN_DELAY_MS,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Initialize the caller
+
+        Args:
+            attempts: Attempts per call, including the first
+            base_delay_ms: Backoff cap before the first retry (doubles per retry)
+            max_delay_ms: Largest backoff cap
+            attempt_timeout: Seconds an attempt (or a streamed chunk) may take
+            deadline: Seconds after which a call stops retrying
+            hedge: Send a duplicate when an attempt runs past the p95 latency
+            hedge_min_delay_ms: Never hedge earlier than this
+            breaker: Circuit breaker (defaults to one built from the config)
+        """
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+
+    async def call(
+        self,
+        operation: str,
+        attempt: Callable[[], Awaitable[str]],
+        admit: Callable[[], AbstractAsyncContextManager]
+    ) -> str:
+        """
+        Make a model call
+
+        Args:
+            operation: Metrics/latency label ("outline", "section", ...)
+            attempt: Makes one request to the model
+            admit: Returns the scheduler slot each attempt must hold
+
+        Returns:
+            The model's response
+
+        Raises:
+            ModelUnavailable: If every attempt failed or the circuit is open
+        """
+        started = time.monotonic()
+        for number in range(self.attempts):
+            probe = self._check_breaker()
+            try:
+                result = await self._hedged(operation, attempt, admit)
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                await self._backoff(operation, number, started, e)
+                continue
+            except Exception as e:
+                # The upstream answered, but not with something usable
+                self.breaker.record_success()
+                raise ModelUnavailable(f"Model call failed: {e}") from e
+            except BaseException:
+                # Cancelled before the upstream answered: no verdict either way
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return result
+        raise ModelUnavailable("Model call failed")
+
+    async def stream(
+        self,
+        operation: str,
+        open_stream: Callable[[], AsyncIterator[str]],
+        admit: Callable[[], AbstractAsyncContextManager]
+    ) -> AsyncIterator[str]:
+        """
+        Make a streaming model call
+
+        Failures before the first chunk are retried like call(); once text
+        has been yielded a failure ends the stream with ModelUnavailable.
+        Streams are never hedged.
+
+        Args:
+            operation: Metrics label
+            open_stream: Starts one streaming request to the model
+            admit: Returns the scheduler slot each attempt must hold
+
+        Returns:
+            Iterator of text chunks
+        """
+        started = time.monotonic()
+        for number in range(self.attempts):
+            probe = self._check_breaker()
+            streamed = False
+            try:
+                async with admit():
+                    chunks = open_stream().__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.attempt_timeout)
+                        except StopAsyncIteration:
+                            break
+                        streamed = True
+                        yield chunk
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                if streamed:
+                    raise ModelUnavailable(f"Model stream interrupted: {e}") from e
+                await self._backoff(operation, number, started, e)
+                continue
+            except Exception as e:
+                self.breaker.record_success()
+                raise ModelUnavailable(f"Model call failed: {e}") from e
+            except BaseException:
+                # Cancelled, or the consumer closed the stream early
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return
+        raise ModelUnavailable("Model call failed")
+
+    def _check_breaker(self) -> bool:
+        """Fail fast while the circuit is open; returns whether this call is the probe"""
+        half_open = self.breaker.opened_at is not None
+        if not self.breaker.allow():
+            raise ModelUnavailable(
+                "The AI model is temporarily unavailable, please retry shortly",
+                retry_after=self.breaker.retry_after()
+            )
+        return half_open
+
+    async def _backoff(self, operation: str, number: int, started: float, error: Exception):
+        """Sleep before the next attempt, or give up if none is left"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** number))
+        last = number == self.attempts - 1
+        if last or time.monotonic() - started + delay > self.deadline:
+            raise ModelUnavailable(f"Model call failed after {number + 1} attempt(s): {error!r}") from error
+        llm_retries.labels(operation).inc()
+        await asyncio.sleep(delay)
+
+    async def _hedged(
+        self,
+        operation: str,
+        attempt: Callable[[], Awaitable[str]],
+        admit: Callable[[], AbstractAsyncContextManager]
+    ) -> str:
+        """Run an attempt, adding a duplicate if it is slower than usual"""
+        hedge_delay = self._hedge_delay(operation)
+        if hedge_delay is None:
+            return await self._attempt(operation, attempt, admit)
+
+        admitted = asyncio.Event()
+        tasks: List[asyncio.Task] = [asyncio.create_task(self._attempt(operation, attempt, admit, admitted))]
+        try:
+            # The hedge timer starts once the attempt is past the scheduler
+            waiter = asyncio.create_task(admitted.wait())
+            await asyncio.wait([tasks[0], waiter], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                llm_hedged_requests.labels(operation).inc()
+                tasks.append(asyncio.create_task(self._attempt(operation, attempt, admit)))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(
+        self,
+        operation: str,
+        attempt: Callable[[], Awaitable[str]],
+        admit: Callable[[], AbstractAsyncContextManager],
+        admitted: Optional[asyncio.Event] = None
+    ) -> str:
+        """One request inside a scheduler slot, bounded by the attempt timeout"""
+        async with admit():
+            if admitted is not None:
+                admitted.set()
+            start = time.monotonic()
+            result = await asyncio.wait_for(attempt(), self.attempt_timeout)
+        self._latencies[operation].append(time.monotonic() - start)
+        return result
+
+    def _hedge_delay(self, operation: str) -> Optional[float]:
+        """Seconds before hedging an attempt, or None to not hedge"""
+        if not self.hedge:
+            return None
+        latencies = self._latencies[operation]
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+        return max(self.hedge_min_delay, p95)
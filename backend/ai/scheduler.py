@@ -0,0 +1,357 @@
+"""
+Scheduler in front of every model call
+
+Calls wait here for two things: a free slot (at most LLM_MAX_CONCURRENCY
+calls in flight per worker process) and room in the rate limit buckets
+(requests per minute and estimated tokens per minute). Waiting calls are
+served by priority first: interactive outline/refine calls go before bulk
+section generation. Within a priority, users take turns, so one user
+generating a large deck cannot push everyone else's calls to the back.
+
+The buckets live in this process, or in a SQLite file that every gunicorn
+worker on the host shares (LLM_RATE_LIMIT_DB_PATH), so the limit holds for
+the whole server. Bulk calls may only draw a bucket down to
+LLM_INTERACTIVE_RESERVE of its size; the rest is kept for interactive calls
+from any worker.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_RATE_LIMIT_RPM,
+    LLM_RATE_LIMIT_TPM,
+    LLM_RATE_LIMIT_DB_PATH,
+    LLM_INTERACTIVE_RESERVE,
+    LLM_OUTPUT_TOKEN_ESTIMATE
+)
+from ai.context import count_tokens
+from services.metrics import llm_queue_wait
+
+# Operations a user is waiting on; everything else is bulk generation
+INTERACTIVE_OPERATIONS = {"outline", "refine"}
+INTERACTIVE = 0
+BULK = 1
+
+# User the current request or job makes model calls for (None for anonymous)
+llm_caller: ContextVar[Optional[int]] = ContextVar("llm_caller", default=None)
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token cost of a call: ~4 characters per prompt token plus the expected output"""
+    return count_tokens(prompt) + LLM_OUTPUT_TOKEN_ESTIMATE
+
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute
+
+    Each bucket holds up to one minute of its limit and refills
+    continuously. A limit of 0 disables that bucket.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = LLM_RATE_LIMIT_RPM,
+        tokens_per_minute: int = LLM_RATE_LIMIT_TPM,
+        interactive_reserve: float = LLM_INTERACTIVE_RESERVE,
+        db_path: str = LLM_RATE_LIMIT_DB_PATH
+    ):
+        """
+        Initialize the limiter
+
+        Args:
+            requests_per_minute: Model calls allowed per minute
+            tokens_per_minute: Estimated tokens allowed per minute
+            interactive_reserve: Fraction of each bucket bulk calls cannot use
+            db_path: SQLite file shared by worker processes (per process when empty)
+        """
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.interactive_reserve = interactive_reserve
+        self.db_path = db_path
+        self._levels: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_rate_limit ("
+                    "name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+                )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any bucket is limited"""
+        return any(limit > 0 for limit in self.limits.values())
+
+    async def acquire(self, tokens: int, priority: int) -> float:
+        """
+        Take one request and `tokens` tokens if every bucket has room
+
+        Args:
+            tokens: Estimated tokens of the call
+            priority: INTERACTIVE or BULK
+
+        Returns:
+            0 when the call may go ahead, otherwise seconds until it might
+        """
+        if not self.enabled:
+            return 0.0
+        costs = {"requests": 1, "tokens": tokens}
+        if self.db_path:
+            return await asyncio.to_thread(self._update_shared, lambda levels: self._take(levels, costs, priority))
+        with self._lock:
+            return self._take(self._levels, costs, priority)
+
+    async def refund(self, tokens: int):
+        """
+        Give back what acquire() took for a call that never ran
+
+        Args:
+            tokens: Estimated tokens the call was charged
+        """
+        if not self.enabled:
+            return
+        costs = {"requests": 1, "tokens": tokens}
+        if self.db_path:
+            await asyncio.to_thread(self._update_shared, lambda levels: self._give_back(levels, costs))
+            return
+        with self._lock:
+            self._give_back(self._levels, costs)
+
+    def _update_shared(self, change: Callable[[Dict[str, Tuple[float, float]]], float]) -> float:
+        """Apply change() to the buckets in the shared SQLite file and return its result"""
+        with self._connect() as conn:
+            # IMMEDIATE takes the write lock up front, so workers update the
+            # buckets one at a time
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = {
+                    name: (level, updated_at)
+                    for name, level, updated_at in conn.execute(
+                        "SELECT name, level, updated_at FROM llm_rate_limit"
+                    )
+                }
+                wait = change(levels)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO llm_rate_limit (name, level, updated_at) VALUES (?, ?, ?)",
+                    [(name, level, updated_at) for name, (level, updated_at) in levels.items()]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def _take(self, levels: Dict[str, Tuple[float, float]], costs: Dict[str, int], priority: int) -> float:
+        """Refill the buckets in `levels` and deduct the costs if they all fit"""
+        now = time.time()
+        wait = 0.0
+        refilled = {}
+        for name, limit in self.limits.items():
+            if limit <= 0:
+                continue
+            rate = limit / 60
+            level, updated_at = levels.get(name, (limit, now))
+            level = min(limit, level + (now - updated_at) * rate)
+            refilled[name] = level
+
+            floor = self.interactive_reserve * limit if priority == BULK else 0.0
+            # A call bigger than the whole bucket waits for a full bucket
+            cost = min(costs[name], limit - floor)
+            if level - cost < floor:
+                wait = max(wait, (floor + cost - level) / rate)
+
+        for name, level in refilled.items():
+            if wait == 0.0:
+                level -= min(costs[name], level)
+            levels[name] = (level, now)
+        return wait
+
+    def _give_back(self, levels: Dict[str, Tuple[float, float]], costs: Dict[str, int]) -> float:
+        """Return the costs to the buckets in `levels`, up to their size"""
+        now = time.time()
+        for name, limit in self.limits.items():
+            if limit <= 0:
+                continue
+            level, updated_at = levels.get(name, (limit, now))
+            levels[name] = (min(limit, level + costs[name]), updated_at)
+        return 0.0
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the shared buckets"""
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+@dataclass(eq=False)
+class _Waiter:
+    """A model call waiting for its turn"""
+    priority: int
+    user: Optional[int]
+    tokens: int
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class LLMScheduler:
+    """Priority, per-user fair queue in front of the rate limiter"""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, limiter: Optional[RateLimiter] = None):
+        """
+        Initialize the scheduler
+
+        Args:
+            max_concurrency: Model calls in flight at once in this process
+            limiter: Rate limiter (defaults to one built from the config)
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = limiter or RateLimiter()
+        self.active = 0
+        # priority -> user -> waiting calls; users are served round-robin
+        self._queues: List["OrderedDict[Optional[int], Deque[_Waiter]]"] = [OrderedDict(), OrderedDict()]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def slot(self, operation: str, prompt: str) -> AsyncIterator[None]:
+        """
+        Wait for this call's turn and hold a slot while it runs
+
+        Args:
+            operation: "outline", "refine", "section" or "summary"
+            prompt: The rendered prompt (for the token estimate)
+        """
+        self._bind_loop()
+        priority = INTERACTIVE if operation in INTERACTIVE_OPERATIONS else BULK
+        waiter = _Waiter(priority, llm_caller.get(), estimate_tokens(prompt), self._loop.create_future())
+        self._queues[priority].setdefault(waiter.user, deque()).append(waiter)
+        self._wakeup.set()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller went away
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+        llm_queue_wait.labels("interactive" if priority == INTERACTIVE else "bulk").observe(
+            time.perf_counter() - waiter.queued_at
+        )
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def queued(self) -> int:
+        """Calls waiting for a turn"""
+        return sum(len(calls) for queue in self._queues for calls in queue.values())
+
+    def _bind_loop(self):
+        """Start the dispatcher on the running loop (again if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._dispatcher is None or self._dispatcher.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._queues = [OrderedDict(), OrderedDict()]
+            self.active = 0
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        """Grant turns to waiting calls as slots and rate limit allow"""
+        while True:
+            waiter = self._peek() if self.active < self.max_concurrency else None
+            if waiter is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if waiter.future.done():
+                # Its caller went away before its turn; don't charge the buckets
+                self._remove(waiter)
+                continue
+
+            try:
+                wait = await self.limiter.acquire(waiter.tokens, waiter.priority)
+            except Exception as e:
+                # A broken shared bucket must not stop model calls altogether
+                print(f"Error checking LLM rate limit: {e}")
+                wait = 0.0
+            if waiter.future.done():
+                # Its caller went away while the buckets were checked
+                self._remove(waiter)
+                if wait == 0:
+                    await self._refund(waiter)
+                continue
+            if wait > 0:
+                # Sleep until the bucket refills, or a new (possibly
+                # higher priority) call arrives and is considered first
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._pop(waiter)
+            if not waiter.future.done():
+                self.active += 1
+                waiter.future.set_result(None)
+
+    async def _refund(self, waiter: _Waiter):
+        """Return the rate limit a call was charged but never used"""
+        try:
+            await self.limiter.refund(waiter.tokens)
+        except Exception as e:
+            print(f"Error refunding LLM rate limit: {e}")
+
+    def _peek(self) -> Optional[_Waiter]:
+        """Next call to serve: highest priority, then the user whose turn it is"""
+        for queue in self._queues:
+            if queue:
+                return next(iter(queue.values()))[0]
+        return None
+
+    def _pop(self, waiter: _Waiter):
+        """Remove a served call and send its user to the back of the line"""
+        queue = self._queues[waiter.priority]
+        calls = queue[waiter.user]
+        calls.popleft()
+        if calls:
+            queue.move_to_end(waiter.user)
+        else:
+            del queue[waiter.user]
+
+    def _remove(self, waiter: _Waiter):
+        """Drop a call whose caller went away before its turn"""
+        queue = self._queues[waiter.priority]
+        calls = queue.get(waiter.user)
+        if calls and waiter in calls:
+            calls.remove(waiter)
+            if not calls:
+                del queue[waiter.user]
+
+    def _release(self):
+        """Free a slot"""
+        self.active = max(0, self.active - 1)
+        self._wakeup.set()
+
+
+# Global LLM scheduler instance
+llm_scheduler = LLMScheduler()
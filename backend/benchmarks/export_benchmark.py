@@ -0,0 +1,87 @@
+"""
+Benchmark the standard and fast export engines
+
+Renders the same synthetic document with both engines, checks that every
+part of the two packages is identical and prints the timings.
+
+Usage (from the backend directory):
+    python -m benchmarks.export_benchmark --sections 150 --runs 5
+"""
+import argparse
+import time
+import zipfile
+from io import BytesIO
+from typing import Callable, Dict, List
+
+from services.export_service import ExportService, fast_docx_writer, fast_pptx_writer
+
+
+def make_sections(count: int, paragraphs: int) -> List[Dict[str, str]]:
+    """Build a synthetic section list"""
+    sentence = "Revenue grew 12% year over year & margins held at <30% despite rising costs. "
+    return [
+        {
+            "title": f"Section {i + 1}: Market Analysis",
+            "content": "\n".join(sentence * 4 for _ in range(paragraphs))
+        }
+        for i in range(count)
+    ]
+
+
+def parts(data: bytes) -> Dict[str, bytes]:
+    """Uncompressed parts of a package"""
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def best_of(runs: int, render: Callable[[], bytes]) -> float:
+    """Fastest of several renders, in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=150)
+    parser.add_argument("--paragraphs", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    topic = "Quarterly Business Review"
+    sections = make_sections(args.sections, args.paragraphs)
+
+    def render_fast(writer):
+        file_stream = BytesIO()
+        writer.write(file_stream, topic, sections)
+        return file_stream.getvalue()
+
+    engines = {
+        "docx": (
+            lambda: ExportService._export_docx_standard(topic, sections).getvalue(),
+            lambda: render_fast(fast_docx_writer())
+        ),
+        "pptx": (
+            lambda: ExportService._export_pptx_standard(topic, sections).getvalue(),
+            lambda: render_fast(fast_pptx_writer())
+        ),
+    }
+
+    print(f"{args.sections} sections x {args.paragraphs} paragraphs, best of {args.runs}")
+    for doc_type, (standard, fast) in engines.items():
+        if parts(standard()) != parts(fast()):
+            raise SystemExit(f"{doc_type}: fast engine output differs from the standard engine")
+
+        standard_ms = best_of(args.runs, standard)
+        fast_ms = best_of(args.runs, fast)
+        print(
+            f"{doc_type}: standard {standard_ms:8.1f} ms   fast {fast_ms:8.1f} ms   "
+            f"speedup {standard_ms / fast_ms:5.1f}x   (output identical)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Load benchmark for the document workflow
+
+Runs register -> login -> suggest-outline -> create project -> generate ->
+refine -> export workflows at a given concurrency and prints throughput
+and p50/p95/p99 latency per endpoint.
+
+By default the app runs inside this process against a temporary SQLite
+database and the fake model backend, so nothing touches the network or
+API quota. --url benchmarks a running server instead (start it with
+LLM_BACKEND=fake to keep it offline).
+
+Usage (from the backend directory):
+    python -m benchmarks.load_benchmark --workflows 50 --concurrency 10
+    python -m benchmarks.load_benchmark --url http://localhost:8000 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+STEPS = ["register", "login", "suggest-outline", "create-project", "generate", "refine", "export"]
+
+
+class WorkflowFailed(Exception):
+    """Raised when a step answers with an error status"""
+
+
+class Recorder:
+    """Latency and status of every request, by workflow step"""
+
+    def __init__(self):
+        """Initialize the recorder"""
+        self.samples: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+
+    async def call(self, client: httpx.AsyncClient, step: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request and record it under step
+
+        Raises:
+            WorkflowFailed: If the response status is 400 or above
+        """
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.samples[step].append((time.perf_counter() - start, 0))
+            raise WorkflowFailed(f"{step}: {e}")
+        self.samples[step].append((time.perf_counter() - start, response.status_code))
+        if response.status_code >= 400:
+            raise WorkflowFailed(f"{step}: HTTP {response.status_code}")
+        return response
+
+
+async def run_workflow(client: httpx.AsyncClient, recorder: Recorder, run_id: str, n: int):
+    """One user's path from sign-up to a downloaded export"""
+    doc_type = "docx" if n % 2 == 0 else "pptx"
+    username = f"bench{run_id}u{n}"
+
+    await recorder.call(client, "register", "POST", "/api/auth/register", json={
+        "email": f"{username}@bench.dev", "username": username, "password": "benchmark-password"
+    })
+    response = await recorder.call(client, "login", "POST", "/api/auth/login", data={
+        "username": username, "password": "benchmark-password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    topic = f"Benchmark topic {n}"
+    response = await recorder.call(client, "suggest-outline", "POST", "/api/ai/suggest-outline", headers=headers, json={
+        "topic": topic, "type": doc_type
+    })
+    response = await recorder.call(client, "create-project", "POST", "/api/projects/", headers=headers, json={
+        "type": doc_type, "topic": topic, "outline": response.json()["outline"]
+    })
+    project_id = response.json()["id"]
+
+    await recorder.call(client, "generate", "POST", "/api/ai/generate", headers=headers, json={
+        "project_id": project_id
+    })
+    await recorder.call(client, "refine", "POST", "/api/ai/refine", headers=headers, json={
+        "project_id": project_id, "section_index": 0, "refinement_prompt": "Make it more concise"
+    })
+    await recorder.call(client, "export", "GET", f"/api/export/{doc_type}/{project_id}", headers=headers)
+
+
+async def run_load(client: httpx.AsyncClient, workflows: int, concurrency: int) -> Dict:
+    """Run the workflows through `concurrency` virtual users and summarize them"""
+    recorder = Recorder()
+    run_id = str(int(time.time() * 1000))
+    queue = asyncio.Queue()
+    for n in range(workflows):
+        queue.put_nowait(n)
+    failures: List[str] = []
+
+    async def user():
+        while not queue.empty():
+            n = queue.get_nowait()
+            try:
+                await run_workflow(client, recorder, run_id, n)
+            except WorkflowFailed as e:
+                failures.append(str(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(max(1, concurrency))))
+    wall = time.perf_counter() - start
+
+    requests = sum(len(samples) for samples in recorder.samples.values())
+    return {
+        "workflows": workflows,
+        "concurrency": concurrency,
+        "failed_workflows": len(failures),
+        "failures": sorted(set(failures)),
+        "wall_seconds": round(wall, 3),
+        "workflows_per_second": round(workflows / wall, 3),
+        "requests_per_second": round(requests / wall, 3),
+        "endpoints": {
+            step: summarize(recorder.samples[step], wall)
+            for step in STEPS if recorder.samples[step]
+        }
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def summarize(samples: List[Tuple[float, int]], wall: float) -> Dict:
+    """Count, error count, throughput and latency percentiles (ms) of one step"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    return {
+        "count": len(samples),
+        "errors": sum(1 for _, status in samples if status == 0 or status >= 400),
+        "throughput_rps": round(len(samples) / wall, 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1)
+    }
+
+
+def print_report(results: Dict):
+    """Print the summary as a table"""
+    print(
+        f"{results['workflows']} workflows at concurrency {results['concurrency']}: "
+        f"{results['wall_seconds']:.2f} s, {results['workflows_per_second']:.2f} workflows/s, "
+        f"{results['requests_per_second']:.2f} requests/s, {results['failed_workflows']} failed"
+    )
+    if results.get("model_calls") is not None:
+        print(f"model calls: {results['model_calls']}")
+    print(f"{'endpoint':<16}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, stats in results["endpoints"].items():
+        print(
+            f"{step:<16}{stats['count']:>7}{stats['errors']:>8}{stats['throughput_rps']:>9.2f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    for failure in results["failures"]:
+        print(f"failure: {failure}")
+
+
+async def benchmark_url(url: str, workflows: int, concurrency: int) -> Dict:
+    """Benchmark a running server"""
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        return await run_load(client, workflows, concurrency)
+
+
+async def benchmark_in_process(workflows: int, concurrency: int) -> Dict:
+    """Benchmark the app inside this process (configure the environment first)"""
+    from main import app
+    from ai.ai_service import ai_service
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            results = await run_load(client, workflows, concurrency)
+    results["model_calls"] = getattr(ai_service.backend, "calls", None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workflows", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--url", default="", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--llm-latency-ms", type=float, help="fake model latency (in-process only)")
+    parser.add_argument("--llm-jitter-ms", type=float, help="fake model jitter (in-process only)")
+    parser.add_argument("--llm-error-rate", type=float, help="fake model failure rate (in-process only)")
+    parser.add_argument("--seed", type=int, help="fake model seed (in-process only)")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--fail-on-error", action="store_true", help="exit with status 1 if any workflow failed")
+    args = parser.parse_args()
+
+    if args.url:
+        results = asyncio.run(benchmark_url(args.url, args.workflows, args.concurrency))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            # Must be set before the app (and its config) is imported
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+            os.environ["EXPORT_CACHE_DIR"] = os.path.join(directory, "export_cache")
+            os.environ["LLM_BACKEND"] = "fake"
+            os.environ["LLM_CACHE_DB_PATH"] = ""
+            overrides: Dict[str, Optional[float]] = {
+                "FAKE_LLM_LATENCY_MS": args.llm_latency_ms,
+                "FAKE_LLM_JITTER_MS": args.llm_jitter_ms,
+                "FAKE_LLM_ERROR_RATE": args.llm_error_rate,
+                "FAKE_LLM_SEED": args.seed
+            }
+            for name, value in overrides.items():
+                if value is not None:
+                    os.environ[name] = str(value)
+            results = asyncio.run(benchmark_in_process(args.workflows, args.concurrency))
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.fail_on_error and results["failed_workflows"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
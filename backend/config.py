@@ -10,14 +10,99 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"  # or run: python -m database.migrations
+
+# Connection pool (server databases)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # per worker process
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # reconnect connections older than this
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# SQLite tuning
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"  # WAL journal with synchronous=NORMAL and mmap
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
 
 # JWT Settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))  # 0 disables the cache
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+# Password hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # existing hashes are upgraded on the next login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # worker processes, 0 hashes in a thread
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "2"))
 
-# Gemini API
+# Model backend
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")  # "gemini" or "fake" (local, for load tests)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))  # time to the response / first chunk
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "400"))
+FAKE_LLM_CHUNK_DELAY_MS = float(os.getenv("FAKE_LLM_CHUNK_DELAY_MS", "50"))  # between streamed chunks
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))  # fraction of calls that fail
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+
+# Model call scheduling
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # model calls in flight per worker process
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "0"))  # requests per minute, 0 = unlimited
+LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "0"))  # estimated tokens per minute, 0 = unlimited
+LLM_RATE_LIMIT_DB_PATH = os.getenv("LLM_RATE_LIMIT_DB_PATH", "")  # SQLite file shared by workers, per process when empty
+LLM_INTERACTIVE_RESERVE = float(os.getenv("LLM_INTERACTIVE_RESERVE", "0.2"))  # share of the limits kept for outline/refine
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "800"))  # added to the prompt estimate per call
+
+# Model call resilience
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))  # attempts per call, including the first
+LLM_RETRY_BASE_DELAY_MS = float(os.getenv("LLM_RETRY_BASE_DELAY_MS", "250"))  # backoff cap before the first retry, doubling
+LLM_RETRY_MAX_DELAY_MS = float(os.getenv("LLM_RETRY_MAX_DELAY_MS", "4000"))
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "60"))  # per attempt, or between streamed chunks
+LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "120"))  # no retries start after this
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"  # duplicate calls slower than p95
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "1000"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))  # consecutive failures, 0 disables
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Content generation
+GENERATION_MODE = os.getenv("GENERATION_MODE", "sequential")  # "sequential" or "concurrent" (faster, sections share outline context)
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+GENERATION_CONTEXT = os.getenv("GENERATION_CONTEXT", "outline")  # "outline" or "summary"
+GENERATION_CONTEXT_TOKENS = int(os.getenv("GENERATION_CONTEXT_TOKENS", "400"))  # context budget per section prompt
+GENERATION_CONTEXT_WINDOW = int(os.getenv("GENERATION_CONTEXT_WINDOW", "3"))  # earlier sections kept as excerpts (sequential)
+REFINE_BATCH_CONCURRENCY = int(os.getenv("REFINE_BATCH_CONCURRENCY", "4"))  # sections refined at the same time per batch
+
+# Idempotency keys (Idempotency-Key header on generate/refine)
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))  # how long a stored response is replayed
+
+# Background generation jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))  # requeue running jobs with no progress for this long
+
+# Model response cache
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")  # shared SQLite tier, disabled when empty
+
+# Export cache
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./export_cache")
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "256"))
+EXPORT_PRERENDER = os.getenv("EXPORT_PRERENDER", "false").lower() == "true"  # render exports after generate/refine
+
+# Export rendering
+EXPORT_ENGINE = os.getenv("EXPORT_ENGINE", "standard")  # "standard" (python-docx/python-pptx) or "fast" (template-based)
+EXPORT_RENDER_WORKERS = int(os.getenv("EXPORT_RENDER_WORKERS", "2"))  # worker processes, 0 renders in-process
+EXPORT_RENDER_MAX_PENDING = int(os.getenv("EXPORT_RENDER_MAX_PENDING", "8"))
+EXPORT_RENDER_RETRY_AFTER_SECONDS = int(os.getenv("EXPORT_RENDER_RETRY_AFTER_SECONDS", "5"))
+EXPORT_BULK_MAX_PROJECTS = int(os.getenv("EXPORT_BULK_MAX_PROJECTS", "50"))
+EXPORT_BULK_RENDER_TIMEOUT_SECONDS = float(os.getenv("EXPORT_BULK_RENDER_TIMEOUT_SECONDS", "120"))  # then unrendered files are skipped
+
+# Metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # expose /metrics
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")  # shared across gunicorn workers, empty on start
 
 # CORS
 ALLOWED_ORIGINS = ["*"]
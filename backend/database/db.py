@@ -1,24 +1,173 @@
 """
 Database connection and session management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from models.models import Base
-from config import DATABASE_URL
-
-# Create database engine
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from typing import Any, AsyncIterator, Dict
+import orjson
+import threading
+import time
+from config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    SQLITE_WAL,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_MB
 )
+from services.metrics import db_query_duration, statement_operation
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class PoolMetrics:
+    """Counters for time spent waiting to check out a pooled connection"""
+    
+    def __init__(self):
+        """Initialize the counters"""
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def record(self, wait: float, timed_out: bool = False):
+        """Record one checkout and how long it waited"""
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the counters along with the pools' current state"""
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.total_wait / attempts * 1000 if attempts else 0.0,
+                "max_wait_ms": self.max_wait * 1000
+            }
+        stats["pool"] = engine.pool.status()
+        stats["async_pool"] = async_engine.pool.status()
+        return stats
+
+
+# Global pool metrics instance
+pool_metrics = PoolMetrics()
+
+
+class _MeteredPool:
+    """Pool mixin that records how long each checkout waited"""
+    
+    def connect(self):
+        """Check out a connection, timing the wait"""
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - start)
+        return connection
+
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    """QueuePool with checkout-wait metrics (sync engine)"""
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool with checkout-wait metrics (async engine)"""
+
+
+def _async_url(url: str) -> str:
+    """Swap the configured driver for its asyncio counterpart"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql":
+        query = dict(parsed.query)
+        # asyncpg takes "ssl" rather than libpq's "sslmode"
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return parsed.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+    return url
+
+
+def _engine_options(url: str, poolclass: type) -> Dict[str, Any]:
+    """Pool and driver options for the configured database"""
+    if url.startswith("sqlite"):
+        options: Dict[str, Any] = {}
+        if "aiosqlite" not in url:
+            options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" not in url and make_url(url).database:
+            options["poolclass"] = poolclass
+        return options
+    
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        # Encoding for native JSON/JSONB columns
+        "json_serializer": lambda value: orjson.dumps(value).decode(),
+        "json_deserializer": orjson.loads
+    }
 
 
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+# Create database engines; background jobs and migrations use the sync
+# engine, API routes use the async one
+ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL, MeteredQueuePool))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, MeteredAsyncQueuePool))
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for concurrent access"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    if SQLITE_WAL:
+        # Readers no longer block the writer, and commits skip an fsync
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    cursor.close()
+
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Note when a statement starts executing"""
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    """Observe how long a statement took to execute"""
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    db_query_duration.labels(statement_operation(statement)).observe(elapsed)
+
+
+for sync_engine in (engine, async_engine.sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", start_query_timer)
+    event.listen(sync_engine, "after_cursor_execute", record_query_time)
+
+# Create session factories; async sessions cannot lazy-load, so objects are
+# not expired on commit
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 
 def get_db():
@@ -28,3 +177,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,173 @@
+"""
+Versioned schema migrations
+
+Each migration runs once per database, inside one transaction, and is
+recorded in the schema_migrations table. New databases get the current
+schema from the baseline migration, so later migrations must be written to
+be no-ops when their change already exists (e.g. checkfirst=True).
+
+Run before starting the server (or leave DB_MIGRATE_ON_STARTUP enabled):
+    python -m database.migrations
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+import json
+import time
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from database.db import engine
+from models.models import Base, IdempotencyRecord, Project, RefinementEvent, Section, project_list_index
+
+# Arbitrary key for the Postgres advisory lock that serializes migrations
+MIGRATION_LOCK_KEY = 721_004_017
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False)
+)
+
+
+def baseline_schema(conn: Connection):
+    """Create any missing tables (the whole schema on a new database)"""
+    Base.metadata.create_all(bind=conn)
+
+
+def migrate_generated_content(conn: Connection):
+    """Move legacy Project.generated_content JSON into the sections table"""
+    db = Session(bind=conn)
+    try:
+        projects = db.query(Project).filter(Project.generated_content.isnot(None)).all()
+        for project in projects:
+            generated_content = json.loads(project.generated_content) or []
+            if not project.sections:
+                for i, data in enumerate(generated_content):
+                    db.add(Section(
+                        project_id=project.id,
+                        index=i,
+                        title=data.get("title", ""),
+                        content=data.get("content"),
+                        feedback=data.get("feedback"),
+                        comment=data.get("comment"),
+                        note=data.get("note")
+                    ))
+            # Clear the legacy column without bumping updated_at
+            db.query(Project).filter(Project.id == project.id).update(
+                {"generated_content": None, "updated_at": project.updated_at},
+                synchronize_session=False
+            )
+        db.flush()
+    finally:
+        db.close()
+
+
+def migrate_refinement_history(conn: Connection):
+    """Move legacy Project.refinement_history JSON into the refinement_events table"""
+    db = Session(bind=conn)
+    try:
+        projects = db.query(Project).filter(Project.refinement_history.isnot(None)).all()
+        for project in projects:
+            for entry in json.loads(project.refinement_history) or []:
+                db.add(RefinementEvent(
+                    project_id=project.id,
+                    section_index=entry.get("section_index", 0),
+                    prompt=entry.get("prompt"),
+                    feedback=entry.get("feedback"),
+                    comment=entry.get("comment"),
+                    original_content=entry.get("original_content"),
+                    refined_content=entry.get("refined_content"),
+                    created_at=datetime.fromisoformat(entry["timestamp"]) if entry.get("timestamp") else datetime.utcnow()
+                ))
+            # Clear the legacy column without bumping updated_at
+            db.query(Project).filter(Project.id == project.id).update(
+                {"refinement_history": None, "updated_at": project.updated_at},
+                synchronize_session=False
+            )
+        db.flush()
+    finally:
+        db.close()
+
+
+def add_project_list_index(conn: Connection):
+    """Index projects on (user_id, updated_at DESC, id DESC) for per-user listing"""
+    project_list_index.create(bind=conn, checkfirst=True)
+
+
+def use_native_json(conn: Connection):
+    """Convert JSON text columns to JSONB on Postgres (SQLite keeps text)"""
+    if conn.dialect.name != "postgresql":
+        return
+    for table, column in (("projects", "outline"), ("generation_jobs", "sections")):
+        conn.execute(text(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb"
+        ))
+
+
+def add_idempotency_keys(conn: Connection):
+    """Create the table of stored Idempotency-Key responses"""
+    IdempotencyRecord.__table__.create(bind=conn, checkfirst=True)
+
+
+def add_job_claim_token(conn: Connection):
+    """Add generation_jobs.claim_token, so a worker can tell it still owns a job"""
+    columns = {column["name"] for column in inspect(conn).get_columns("generation_jobs")}
+    if "claim_token" not in columns:
+        conn.execute(text("ALTER TABLE generation_jobs ADD COLUMN claim_token VARCHAR"))
+
+
+# (version, name, migration) in the order they are applied; never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline schema", baseline_schema),
+    (2, "move generated content to sections", migrate_generated_content),
+    (3, "move refinement history to refinement events", migrate_refinement_history),
+    (4, "project list index", add_project_list_index),
+    (5, "native JSON columns", use_native_json),
+    (6, "idempotency keys", add_idempotency_keys),
+    (7, "job claim token", add_job_claim_token),
+]
+
+
+def run_migrations(bind: Engine = engine, attempts: int = 3):
+    """
+    Apply every migration the database has not recorded yet
+
+    Postgres serializes concurrent runners (e.g. several gunicorn workers
+    starting at once) with an advisory lock. SQLite has none, so a runner
+    that loses the race rolls back and retries, and then finds the
+    migrations already recorded.
+
+    Args:
+        bind: Engine of the database to migrate
+        attempts: Tries before giving up when another process is migrating
+    """
+    for attempt in range(attempts):
+        try:
+            with bind.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                schema_migrations.create(bind=conn, checkfirst=True)
+                applied = set(conn.scalars(select(schema_migrations.c.version)))
+
+                for version, name, migrate in MIGRATIONS:
+                    if version in applied:
+                        continue
+                    migrate(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    ))
+                    print(f"Applied migration {version}: {name}")
+            return
+        except (IntegrityError, OperationalError):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    run_migrations()
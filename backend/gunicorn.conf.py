@@ -0,0 +1,28 @@
+"""
+Gunicorn settings (loaded automatically when gunicorn starts in this directory)
+
+With PROMETHEUS_MULTIPROC_DIR set, workers write their metrics to files in
+that directory. Clear it when the server starts so values from a previous
+run are not reported, and drop the in-flight gauges of workers that exit.
+"""
+import os
+import shutil
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def on_starting(server):
+    """Empty the metrics directory before any worker starts"""
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Stop reporting the live gauges of an exited worker"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,23 +1,33 @@
 """
 Main FastAPI application
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+import asyncio
 import os
 
-from config import ALLOWED_ORIGINS
-from database.db import init_db
+from config import ALLOWED_ORIGINS, DB_MIGRATE_ON_STARTUP, METRICS_ENABLED
+from database.db import pool_metrics
+from database.migrations import run_migrations
 from routes import auth, projects, ai, export
+from services.job_service import job_service
+from services.metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, render_latest
+from services.password_pool import password_pool
+from services.render_pool import render_pool
 
-# Initialize database
-init_db()
+# Bring the database schema up to date
+if DB_MIGRATE_ON_STARTUP:
+    run_migrations()
 
 # Create FastAPI app
 app = FastAPI(
     title="AI Document Generation Platform",
     description="AI-powered document authoring and generation platform",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -29,6 +39,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency and in-flight metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def database_busy(request: Request, exc: PoolTimeoutError):
+    """503 when no pooled database connection freed up within DB_POOL_TIMEOUT"""
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "The server is busy, please retry shortly"},
+        headers={"Retry-After": "5"}
+    )
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Start the background generation job workers"""
+    job_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Stop the background generation job workers"""
+    await job_service.stop()
+
+
+@app.on_event("startup")
+async def start_render_pool():
+    """Start the export render worker processes"""
+    await asyncio.to_thread(render_pool.start)
+
+
+@app.on_event("shutdown")
+def stop_render_pool():
+    """Stop the export render worker processes"""
+    render_pool.shutdown()
+
+
+@app.on_event("startup")
+async def start_password_pool():
+    """Start the password hashing worker processes"""
+    await asyncio.to_thread(password_pool.start)
+
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    """Stop the password hashing worker processes"""
+    password_pool.shutdown()
+
+
+@app.get("/api/health/db")
+def database_pool_stats():
+    """Connection pool checkout-wait metrics for this worker process"""
+    return pool_metrics.stats()
+
+
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus metrics for every worker process"""
+        return Response(content=render_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(projects.router)
@@ -1,14 +1,41 @@
 """
 Database models for the application
 """
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+import orjson
 
 Base = declarative_base()
 
 
+class JSONColumn(TypeDecorator):
+    """JSON value stored as JSONB on Postgres and as orjson-encoded text elsewhere"""
+    impl = Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        """Use the native JSONB type where the database has one"""
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+    
+    def process_bind_param(self, value, dialect):
+        """Encode the value on the way in (the Postgres driver encodes JSONB itself)"""
+        if value is None or dialect.name == "postgresql":
+            return value
+        return orjson.dumps(value).decode()
+    
+    def process_result_value(self, value, dialect):
+        """Decode the value on the way out"""
+        if value is None or dialect.name == "postgresql":
+            return value
+        return orjson.loads(value)
+
+
 class User(Base):
     """User model for authentication"""
     __tablename__ = "users"
@@ -31,11 +58,120 @@ class Project(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     type = Column(String, nullable=False)  # "docx" or "pptx"
     topic = Column(String, nullable=False)
-    outline = Column(Text, nullable=True)  # JSON string
-    generated_content = Column(Text, nullable=True)  # JSON string
-    refinement_history = Column(Text, nullable=True)  # JSON string
+    outline = Column(JSONColumn, nullable=True)  # List of section titles
+    generated_content = Column(Text, nullable=True)  # Legacy JSON string, migrated to sections
+    refinement_history = Column(Text, nullable=True)  # Legacy JSON string, migrated to refinement_events
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship
     owner = relationship("User", back_populates="projects")
+    sections = relationship(
+        "Section",
+        back_populates="project",
+        order_by="Section.index",
+        cascade="all, delete-orphan"
+    )
+    refinement_events = relationship("RefinementEvent", back_populates="project", cascade="all, delete-orphan")
+    jobs = relationship("GenerationJob", back_populates="project", cascade="all, delete-orphan")
+
+
+# Per-user project listing: filters on user_id, newest first, id as tie-breaker
+project_list_index = Index(
+    "ix_projects_user_id_updated_at_id",
+    Project.user_id,
+    Project.updated_at.desc(),
+    Project.id.desc()
+)
+
+
+class Section(Base):
+    """Generated section/slide of a project"""
+    __tablename__ = "sections"
+    __table_args__ = (
+        Index("ix_sections_project_id_index", "project_id", "index", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    index = Column(Integer, nullable=False)
+    title = Column(String, nullable=False)
+    content = Column(Text, nullable=True)
+    feedback = Column(String, nullable=True)  # "like" or "dislike"
+    comment = Column(Text, nullable=True)
+    note = Column(Text, nullable=True)  # User's personal note
+    version = Column(Integer, nullable=False)
+    
+    # Concurrent writers to the same section fail instead of overwriting each other
+    __mapper_args__ = {"version_id_col": version}
+    
+    # Relationship
+    project = relationship("Project", back_populates="sections")
+    
+    def to_dict(self) -> dict:
+        """Return the section in the generated_content JSON format"""
+        data = {"title": self.title, "content": self.content, "index": self.index}
+        for key in ("feedback", "comment", "note"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return data
+
+
+class RefinementEvent(Base):
+    """Append-only record of a refinement or feedback on a section"""
+    __tablename__ = "refinement_events"
+    __table_args__ = (
+        Index("ix_refinement_events_project_id_id", "project_id", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    section_index = Column(Integer, nullable=False)
+    prompt = Column(Text, nullable=True)
+    feedback = Column(String, nullable=True)
+    comment = Column(Text, nullable=True)
+    original_content = Column(Text, nullable=True)  # First 100 characters
+    refined_content = Column(Text, nullable=True)  # First 100 characters
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationship
+    project = relationship("Project", back_populates="refinement_events")
+
+
+class IdempotencyRecord(Base):
+    """Response stored for a client's Idempotency-Key"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_user_id_key", "user_id", "key", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    operation = Column(String, nullable=False)  # e.g. "generate"
+    fingerprint = Column(String, nullable=False)  # Hash of the operation and request body
+    status_code = Column(Integer, nullable=True)  # None while the first request is in progress
+    response = Column(JSONColumn, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GenerationJob(Base):
+    """Background content generation job for a project"""
+    __tablename__ = "generation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String, nullable=False, default="queued", index=True)  # "queued", "running", "completed" or "failed"
+    mode = Column(String, nullable=True)  # "concurrent" or "sequential"
+    total_sections = Column(Integer, nullable=False, default=0)
+    completed_sections = Column(Integer, nullable=False, default=0)
+    sections = Column(JSONColumn, nullable=True)  # Finished sections keyed by index (as a string)
+    error = Column(Text, nullable=True)
+    claim_token = Column(String, nullable=True)  # Set by the worker running the job; its writes require it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship
+    project = relationship("Project", back_populates="jobs")
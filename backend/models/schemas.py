@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal, Union
 from datetime import datetime
 
 
@@ -57,7 +57,6 @@ class ProjectResponse(BaseModel):
     topic: str
     outline: Optional[Any] = None
     generated_content: Optional[Any] = None
-    refinement_history: Optional[Any] = None
     created_at: datetime
     updated_at: datetime
     
@@ -65,9 +64,45 @@ class ProjectResponse(BaseModel):
         from_attributes = True
 
 
+class ProjectSummary(BaseModel):
+    id: int
+    type: str
+    topic: str
+    section_count: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class ProjectSummaryPage(BaseModel):
+    items: List[ProjectSummary]
+    next_cursor: Optional[str] = None  # pass as cursor to get the next page
+
+
+# Refinement History Schemas
+class RefinementEventResponse(BaseModel):
+    id: int
+    section_index: int
+    prompt: Optional[str] = None
+    feedback: Optional[str] = None
+    comment: Optional[str] = None
+    original_content: Optional[str] = None
+    refined_content: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class RefinementHistoryResponse(BaseModel):
+    items: List[RefinementEventResponse]
+    next_before_id: Optional[int] = None  # pass as before_id to get the next page
+
+
 # AI Generation Schemas
 class GenerateContentRequest(BaseModel):
     project_id: int
+    mode: Optional[str] = None  # "concurrent" or "sequential"
+    background: bool = False  # enqueue a job instead of generating in the request
 
 
 class RefineContentRequest(BaseModel):
@@ -78,6 +113,34 @@ class RefineContentRequest(BaseModel):
     comment: Optional[str] = None
 
 
+class RefineBatchRequest(BaseModel):
+    project_id: int
+    section_indices: Union[Literal["all"], List[int]] = "all"
+    refinement_prompt: str
+
+
 class SuggestOutlineRequest(BaseModel):
     topic: str
     type: str  # "docx" or "pptx"
+
+
+# Generation Job Schemas
+class JobResponse(BaseModel):
+    id: int
+    project_id: int
+    status: str
+    mode: Optional[str] = None
+    total_sections: int
+    completed_sections: int
+    sections: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+# Export Schemas
+class BulkExportRequest(BaseModel):
+    project_ids: List[int]
@@ -1,46 +1,152 @@
 """
 AI generation routes for content creation and refinement
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-import json
-from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Any, Dict, List, Optional
+import orjson
 
-from database.db import get_db
-from models.models import User, Project
+from database.db import AsyncSessionLocal, get_async_db
+from models.models import Project, GenerationJob, RefinementEvent, Section
 from models.schemas import (
     GenerateContentRequest,
     RefineContentRequest,
-    SuggestOutlineRequest
+    RefineBatchRequest,
+    SuggestOutlineRequest,
+    JobResponse
 )
-from services.auth import get_current_user
+from services.auth import get_current_principal
+from services.principal_cache import Principal
+from services.export_cache import export_cache
+from services.idempotency import idempotency_store
+from services.job_service import job_service
+from services.section_service import section_service
+from services.single_flight import SingleFlight
 from ai.ai_service import ai_service
+from ai.resilience import ModelUnavailable
+from ai.scheduler import llm_caller
+from config import EXPORT_PRERENDER
 
-router = APIRouter(prefix="/api/ai", tags=["AI Generation"])
+
+
+async def bind_llm_caller(current_user: Principal = Depends(get_current_principal)):
+    """Attribute the request's model calls to its user for fair queuing"""
+    llm_caller.set(current_user.id)
+
+
+router = APIRouter(prefix="/api/ai", tags=["AI Generation"], dependencies=[Depends(bind_llm_caller)])
+
+# Identical generate requests in flight at once share one generation
+generation_flight = SingleFlight("generate")
+
+
+def _model_unavailable(error: ModelUnavailable) -> HTTPException:
+    """503 returned when the model call failed after retries (nothing is saved)"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def _section_conflict() -> HTTPException:
+    """409 returned when a section changed while the model was working on it"""
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Section was modified by another request, please retry"
+    )
+
+
+async def _load_current_sections(db: AsyncSession, versions: Dict[int, int]) -> List[Section]:
+    """
+    Reload sections by id for writing, checking they are still as they were read
+    
+    Model-backed routes release their session during the model call, so the
+    sections are read again in a short write transaction afterwards.
+    
+    Args:
+        db: Database session for the write
+        versions: Section id -> version seen before the model call
+    
+    Returns:
+        The sections in outline order
+    
+    Raises:
+        HTTPException: 409 if a section was changed or deleted in the meantime
+    """
+    sections = (await db.execute(
+        select(Section).where(Section.id.in_(versions)).order_by(Section.index)
+    )).scalars().all()
+    if len(sections) != len(versions) or any(section.version != versions[section.id] for section in sections):
+        raise _section_conflict()
+    return list(sections)
 
 
 @router.post("/suggest-outline")
-def suggest_outline(
+async def suggest_outline(
     request: SuggestOutlineRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Suggest an outline for a document based on topic"""
-    outline = ai_service.suggest_outline(request.topic, request.type)
+    try:
+        outline = await ai_service.suggest_outline(request.topic, request.type)
+    except ModelUnavailable as e:
+        raise _model_unavailable(e)
     return {"outline": outline}
 
 
+@router.get("/cache/stats")
+async def cache_stats(current_user: Principal = Depends(get_current_principal)):
+    """Get hit/miss counters for the model response cache"""
+    if ai_service.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ai_service.cache.stats()}
+
+
 @router.post("/generate")
-def generate_content(
+async def generate_content(
     request: GenerateContentRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Generate content for all sections/slides in a project"""
+    """
+    Generate content for all sections/slides in a project
+    
+    With `background` set, a generation job is queued instead and its
+    status is returned with 202 Accepted; poll GET /api/ai/jobs/{id}.
+    
+    Requests with an Idempotency-Key header are safe to retry: a repeat of
+    a finished request gets its stored response. Identical requests that
+    arrive while a generation is running share it either way.
+    """
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "generate", request.model_dump(), response,
+        lambda: _generate_content(request, background_tasks, response, current_user, db)
+    )
+
+
+async def _generate_content(
+    request: GenerateContentRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    current_user: Principal,
+    db: AsyncSession
+) -> Dict[str, Any]:
+    """Generate (or queue) a project's content, see generate_content"""
     # Get project
-    project = db.query(Project).filter(
-        Project.id == request.project_id,
-        Project.user_id == current_user.id
-    ).first()
+    project = (await db.execute(
+        select(Project).where(
+            Project.id == request.project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not project:
         raise HTTPException(
@@ -49,7 +155,7 @@ def generate_content(
         )
     
     # Parse outline
-    outline = json.loads(project.outline) if project.outline else []
+    outline = project.outline or []
     
     if not outline:
         raise HTTPException(
@@ -57,30 +163,35 @@ def generate_content(
             detail="Project has no outline defined"
         )
     
-    # Generate content for each section
-    generated_sections = []
-    context = ""
+    if request.mode is not None and request.mode not in ["concurrent", "sequential"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Mode must be either 'concurrent' or 'sequential'"
+        )
+    
+    if request.background:
+        job = await db.run_sync(lambda session: job_service.enqueue(session, project, mode=request.mode))
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "message": "Content generation queued",
+            "job": _job_response(job)
+        }
     
-    for i, section_title in enumerate(outline):
-        content = ai_service.generate_section_content(
-            topic=project.topic,
-            section_title=section_title,
-            doc_type=project.type,
-            context=context if i > 0 else None
+    project_id, topic, doc_type = project.id, project.topic, project.type
+    # Don't hold a connection (and SQLite read lock) while the model works
+    await db.close()
+    
+    # Generate content for each section, or join the same generation in flight
+    try:
+        generated_sections = await generation_flight.run(
+            (project_id, request.mode, doc_type, topic, tuple(outline)),
+            lambda: _generate_and_save(project_id, topic, outline, doc_type, request.mode)
         )
-        
-        generated_sections.append({
-            "title": section_title,
-            "content": content,
-            "index": i
-        })
-        
-        # Build context for next section
-        context = f"{context}\n{section_title}: {content[:200]}..."
+    except ModelUnavailable as e:
+        raise _model_unavailable(e)
     
-    # Save generated content
-    project.generated_content = json.dumps(generated_sections)
-    db.commit()
+    if EXPORT_PRERENDER:
+        background_tasks.add_task(export_cache.prerender_project, project_id)
     
     return {
         "message": "Content generated successfully",
@@ -88,18 +199,231 @@ def generate_content(
     }
 
 
+async def _generate_and_save(
+    project_id: int,
+    topic: str,
+    outline: List[str],
+    doc_type: str,
+    mode: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Generate every section and save them (in its own session, as it may outlive the request)"""
+    generated_sections = await ai_service.generate_sections(
+        topic=topic,
+        outline=outline,
+        doc_type=doc_type,
+        mode=mode
+    )
+    
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(section_service.replace_sections, project_id, generated_sections)
+        try:
+            await db.commit()
+        except (StaleDataError, IntegrityError):
+            # A refine changed a section, or another generation inserted
+            # the same sections, while the model was working
+            await db.rollback()
+            raise _section_conflict()
+    return generated_sections
+
+
+@router.post("/generate/stream")
+async def generate_content_stream(
+    request: GenerateContentRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Generate content for all sections/slides, streamed as Server-Sent Events
+    
+    Emits a "token" event for each text chunk, a "section" event as soon as
+    a section is finished (it is saved to the project at the same time) and
+    a final "done" event.
+    """
+    # Get project
+    project = (await db.execute(
+        select(Project).where(
+            Project.id == request.project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
+    
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
+    # Parse outline
+    outline = project.outline or []
+    
+    if not outline:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Project has no outline defined"
+        )
+    
+    if request.mode is not None and request.mode not in ["concurrent", "sequential"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Mode must be either 'concurrent' or 'sequential'"
+        )
+    
+    project_id, topic, doc_type = project.id, project.topic, project.type
+    # Don't hold a connection while the model streams; each write below
+    # uses a short session of its own
+    await db.close()
+    
+    async def event_stream():
+        sections = [None] * len(outline)
+        yield _sse("start", {"project_id": project_id, "total": len(outline)})
+        
+        try:
+            async for event in ai_service.iter_sections(
+                topic=topic,
+                outline=outline,
+                doc_type=doc_type,
+                mode=request.mode,
+                stream_tokens=True
+            ):
+                if event["event"] == "token":
+                    yield _sse("token", {"index": event["index"], "text": event["text"]})
+                    continue
+                
+                # Save each finished section as it arrives
+                section = event["section"]
+                sections[section["index"]] = section
+                async with AsyncSessionLocal() as write_db:
+                    await write_db.run_sync(
+                        section_service.save_section,
+                        project_id,
+                        {**section, "feedback": None, "comment": None, "note": None}
+                    )
+                    await write_db.commit()
+                
+                yield _sse("section", section)
+            
+            # Drop sections left over from a longer previous outline
+            async with AsyncSessionLocal() as write_db:
+                await write_db.run_sync(section_service.replace_sections, project_id, sections)
+                await write_db.commit()
+        except ModelUnavailable as e:
+            # Sections finished so far stay saved; the rest keep their old content
+            yield _sse("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        except (StaleDataError, IntegrityError):
+            yield _sse("error", {"detail": "Section was modified by another request, please retry"})
+            return
+        
+        yield _sse("done", {"message": "Content generated successfully"})
+    
+    if EXPORT_PRERENDER:
+        # Runs after the stream has finished
+        background_tasks.add_task(export_cache.prerender_project, project_id)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the status and progress of a generation job"""
+    job = (await db.execute(
+        select(GenerationJob).where(
+            GenerationJob.id == job_id,
+            GenerationJob.user_id == current_user.id
+        )
+    )).scalars().first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return _job_response(job)
+
+
+@router.post("/jobs/{job_id}/resume", response_model=JobResponse)
+async def resume_job(
+    job_id: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Requeue a failed generation job from its first unfinished section"""
+    job = (await db.execute(
+        select(GenerationJob).where(
+            GenerationJob.id == job_id,
+            GenerationJob.user_id == current_user.id
+        )
+    )).scalars().first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    if job.status != "failed":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only failed jobs can be resumed"
+        )
+    
+    job = await db.run_sync(job_service.resume, job)
+    return _job_response(job)
+
+
+def _job_response(job: GenerationJob) -> JobResponse:
+    """Build a job response with finished sections in outline order"""
+    response = JobResponse.model_validate(job)
+    sections = job.sections or {}
+    response.sections = [sections[key] for key in sorted(sections, key=int)]
+    return response
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
 @router.post("/refine")
-def refine_content(
+async def refine_content(
     request: RefineContentRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Refine content for a specific section"""
-    # Get project
-    project = db.query(Project).filter(
-        Project.id == request.project_id,
-        Project.user_id == current_user.id
-    ).first()
+    """Refine content for a specific section (retry-safe with an Idempotency-Key header)"""
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "refine", request.model_dump(), response,
+        lambda: _refine_content(request, background_tasks, current_user, db)
+    )
+
+
+async def _refine_content(
+    request: RefineContentRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Principal,
+    db: AsyncSession
+) -> Dict[str, Any]:
+    """Refine one section, see refine_content"""
+    # Check project ownership
+    project = (await db.execute(
+        select(Project.id).where(
+            Project.id == request.project_id,
+            Project.user_id == current_user.id
+        )
+    )).first()
     
     if not project:
         raise HTTPException(
@@ -107,66 +431,191 @@ def refine_content(
             detail="Project not found"
         )
     
-    # Parse generated content
-    generated_content = json.loads(project.generated_content) if project.generated_content else []
+    # Get current section
+    section = await db.run_sync(section_service.get_section, project.id, request.section_index)
     
-    if not generated_content or request.section_index >= len(generated_content):
+    if not section:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid section index"
         )
     
-    # Get current section
-    section = generated_content[request.section_index]
-    original_content = section['content']
+    section_id, section_version, section_title = section.id, section.version, section.title
+    original_content = section.content or ""
+    
+    # Don't hold a connection while the model works
+    await db.close()
     
     # Refine content
-    if request.feedback == 'like':
-        # If user likes it, don't change content, just record feedback
-        refined_content = original_content
-    elif request.feedback == 'dislike' and request.comment:
-        # If user dislikes and provides comment, use comment as instruction
-        refined_content = ai_service.refine_content(
-            original_content=original_content,
-            refinement_prompt=request.comment,
-            section_title=section['title']
-        )
-    else:
-        # Standard refinement
-        refined_content = ai_service.refine_content(
-            original_content=original_content,
-            refinement_prompt=request.refinement_prompt,
-            section_title=section['title']
-        )
-    
-    # Update section content and metadata
-    section['content'] = refined_content
-    if request.feedback:
-        section['feedback'] = request.feedback
-        if request.feedback == 'dislike' and request.comment:
-            section['comment'] = request.comment
+    try:
+        if request.feedback == 'like':
+            # If user likes it, don't change content, just record feedback
+            refined_content = original_content
+        elif request.feedback == 'dislike' and request.comment:
+            # If user dislikes and provides comment, use comment as instruction
+            refined_content = await ai_service.refine_content(
+                original_content=original_content,
+                refinement_prompt=request.comment,
+                section_title=section_title
+            )
+        else:
+            # Standard refinement
+            refined_content = await ai_service.refine_content(
+                original_content=original_content,
+                refinement_prompt=request.refinement_prompt,
+                section_title=section_title
+            )
+    except ModelUnavailable as e:
+        raise _model_unavailable(e)
+    
+    async with AsyncSessionLocal() as db:
+        section = (await _load_current_sections(db, {section_id: section_version}))[0]
+        
+        # Update section content and metadata
+        section.content = refined_content
+        if request.feedback:
+            section.feedback = request.feedback
+            if request.feedback == 'dislike' and request.comment:
+                section.comment = request.comment
         
-    generated_content[request.section_index] = section
-    
-    # Save updated content
-    project.generated_content = json.dumps(generated_content)
-    
-    # Update refinement history
-    refinement_history = json.loads(project.refinement_history) if project.refinement_history else []
-    refinement_history.append({
-        "section_index": request.section_index,
-        "timestamp": datetime.utcnow().isoformat(),
-        "prompt": request.refinement_prompt,
-        "feedback": request.feedback,
-        "comment": request.comment,
-        "original_content": original_content[:100] + "...",
-        "refined_content": refined_content[:100] + "..."
-    })
-    project.refinement_history = json.dumps(refinement_history)
-    
-    db.commit()
+        # Record refinement history
+        db.add(RefinementEvent(
+            project_id=project.id,
+            section_index=request.section_index,
+            prompt=request.refinement_prompt,
+            feedback=request.feedback,
+            comment=request.comment,
+            original_content=original_content[:100] + "...",
+            refined_content=refined_content[:100] + "..."
+        ))
+        await db.run_sync(section_service.touch_project, project.id)
+        
+        try:
+            await db.commit()
+        except StaleDataError:
+            await db.rollback()
+            raise _section_conflict()
+    
+    if EXPORT_PRERENDER:
+        background_tasks.add_task(export_cache.prerender_project, project.id)
+    
+    return {
+        "message": "Content refined successfully",
+        "section": section.to_dict()
+    }
+
+
+@router.post("/refine/batch")
+async def refine_content_batch(
+    request: RefineBatchRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Apply one refinement instruction to several sections
+    
+    The sections are refined concurrently and saved in one transaction, so
+    either every section is updated or (when the model is unavailable or
+    another request changed one of them) none is. Retry-safe with an
+    Idempotency-Key header.
+    """
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "refine_batch", request.model_dump(), response,
+        lambda: _refine_content_batch(request, background_tasks, current_user, db)
+    )
+
+
+async def _refine_content_batch(
+    request: RefineBatchRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Principal,
+    db: AsyncSession
+) -> Dict[str, Any]:
+    """Refine several sections, see refine_content_batch"""
+    # Check project ownership
+    project = (await db.execute(
+        select(Project.id).where(
+            Project.id == request.project_id,
+            Project.user_id == current_user.id
+        )
+    )).first()
+    
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
+    indices = None
+    if request.section_indices != "all":
+        indices = sorted(set(request.section_indices))
+        if not indices:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No sections selected"
+            )
+    
+    # Get current sections
+    sections = await db.run_sync(section_service.get_sections_at, project.id, indices)
+    
+    if indices is not None and len(sections) != len(indices):
+        found = {section.index for section in sections}
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid section index: {', '.join(str(i) for i in indices if i not in found)}"
+        )
+    
+    if not sections:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Project has no generated content"
+        )
+    
+    versions = {section.id: section.version for section in sections}
+    originals = [(section.title, section.content or "") for section in sections]
+    
+    # Don't hold a connection while the model works
+    await db.close()
+    
+    # Refine content
+    try:
+        refined_contents = await ai_service.refine_sections(
+            originals,
+            refinement_prompt=request.refinement_prompt
+        )
+    except ModelUnavailable as e:
+        raise _model_unavailable(e)
+    
+    async with AsyncSessionLocal() as db:
+        sections = await _load_current_sections(db, versions)
+        
+        # Update sections and record refinement history in one batch
+        events = []
+        for section, (_, original_content), refined_content in zip(sections, originals, refined_contents):
+            section.content = refined_content
+            events.append({
+                "project_id": project.id,
+                "section_index": section.index,
+                "prompt": request.refinement_prompt,
+                "original_content": original_content[:100] + "...",
+                "refined_content": refined_content[:100] + "..."
+            })
+        
+        try:
+            await db.execute(insert(RefinementEvent), events)
+            await db.run_sync(section_service.touch_project, project.id)
+            await db.commit()
+        except StaleDataError:
+            await db.rollback()
+            raise _section_conflict()
+    
+    if EXPORT_PRERENDER:
+        background_tasks.add_task(export_cache.prerender_project, project.id)
     
     return {
         "message": "Content refined successfully",
-        "section": section
+        "sections": [section.to_dict() for section in sections]
     }
@@ -3,30 +3,39 @@ Authentication routes for user registration and login
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from database.db import get_db
+from database.db import get_async_db
 from models.models import User
 from models.schemas import UserCreate, UserResponse, Token
 from services.auth import (
-    get_password_hash,
-    verify_password,
     create_access_token,
     get_current_user
 )
-from config import ACCESS_TOKEN_EXPIRE_MINUTES
+from services.password_pool import PasswordPoolSaturated, password_pool
+from config import ACCESS_TOKEN_EXPIRE_MINUTES, PASSWORD_HASH_RETRY_AFTER_SECONDS
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
 
+def _busy() -> HTTPException:
+    """503 returned when the password hashing pool is full"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests, please retry shortly",
+        headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)}
+    )
+
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if user already exists
-    existing_user = db.query(User).filter(
-        (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
+    existing_user = (await db.execute(select(User).where(
+        or_(User.email == user_data.email, User.username == user_data.username)
+    ))).scalars().first()
     
     if existing_user:
         raise HTTPException(
@@ -35,7 +44,10 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await password_pool.hash(user_data.password)
+    except PasswordPoolSaturated:
+        raise _busy()
     new_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -43,32 +55,46 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login and get access token"""
     # Find user
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = (await db.execute(
+        select(User).where(User.username == form_data.username)
+    )).scalars().first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await password_pool.verify(form_data.password, user.hashed_password)
+        except PasswordPoolSaturated:
+            raise _busy()
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade hashes made with a different cost factor
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username},
+        data={"sub": user.username, "uid": user.id},
         expires_delta=access_token_expires
     )
     
@@ -1,31 +1,50 @@
 """
 Export routes for generating downloadable documents
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-import json
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List
+import asyncio
+import re
+import time
+import zipfile
 
-from database.db import get_db
-from models.models import User, Project
-from services.auth import get_current_user
-from services.export_service import export_service
+from database.db import get_async_db
+from models.models import Project, Section
+from models.schemas import BulkExportRequest
+from services.auth import get_current_principal
+from services.principal_cache import Principal
+from services.export_cache import export_cache
+from services.render_pool import RenderPoolSaturated, render_pool
+from config import EXPORT_RENDER_RETRY_AFTER_SECONDS, EXPORT_BULK_MAX_PROJECTS, EXPORT_BULK_RENDER_TIMEOUT_SECONDS
+from services.section_service import section_service
 
 router = APIRouter(prefix="/api/export", tags=["Export"])
 
+MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+}
+
 
 @router.get("/docx/{project_id}")
-def export_docx(
+async def export_docx(
     project_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Export project as a Word document"""
     # Get project
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.user_id == current_user.id
-    ).first()
+    project = (await db.execute(
+        select(Project).where(
+            Project.id == project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not project:
         raise HTTPException(
@@ -39,8 +58,8 @@ def export_docx(
             detail="Project is not a Word document type"
         )
     
-    # Parse generated content
-    generated_content = json.loads(project.generated_content) if project.generated_content else []
+    # Load generated content
+    generated_content = await db.run_sync(section_service.get_sections, project.id)
     
     if not generated_content:
         raise HTTPException(
@@ -48,34 +67,24 @@ def export_docx(
             detail="No content has been generated for this project"
         )
     
-    # Generate document
-    file_stream = export_service.export_docx(
-        topic=project.topic,
-        sections=generated_content
-    )
-    
-    # Return as downloadable file
-    filename = f"{project.topic.replace(' ', '_')}.docx"
-    
-    return StreamingResponse(
-        file_stream,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return await _export_response(request, "docx", project.topic, generated_content)
 
 
 @router.get("/pptx/{project_id}")
-def export_pptx(
+async def export_pptx(
     project_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Export project as a PowerPoint presentation"""
     # Get project
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.user_id == current_user.id
-    ).first()
+    project = (await db.execute(
+        select(Project).where(
+            Project.id == project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not project:
         raise HTTPException(
@@ -89,8 +98,8 @@ def export_pptx(
             detail="Project is not a PowerPoint presentation type"
         )
     
-    # Parse generated content
-    generated_content = json.loads(project.generated_content) if project.generated_content else []
+    # Load generated content
+    generated_content = await db.run_sync(section_service.get_sections, project.id)
     
     if not generated_content:
         raise HTTPException(
@@ -98,17 +107,219 @@ def export_pptx(
             detail="No content has been generated for this project"
         )
     
-    # Generate presentation
-    file_stream = export_service.export_pptx(
-        topic=project.topic,
-        slides=generated_content
-    )
+    return await _export_response(request, "pptx", project.topic, generated_content)
+
+
+@router.post("/bulk")
+async def export_bulk(
+    request: BulkExportRequest,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Export several projects as one ZIP archive
     
-    # Return as downloadable file
-    filename = f"{project.topic.replace(' ', '_')}.pptx"
+    Projects are rendered in parallel and each file is streamed into the
+    archive as soon as it is ready, so memory use does not grow with the
+    number of projects.
+    """
+    project_ids = list(dict.fromkeys(request.project_ids))
+    
+    if not project_ids or len(project_ids) > EXPORT_BULK_MAX_PROJECTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Provide between 1 and {EXPORT_BULK_MAX_PROJECTS} project ids"
+        )
+    
+    # Get projects
+    projects = (await db.execute(
+        select(Project.id, Project.type, Project.topic).where(
+            Project.id.in_(project_ids),
+            Project.user_id == current_user.id
+        )
+    )).all()
+    
+    missing = set(project_ids) - {project.id for project in projects}
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Projects not found: {sorted(missing)}"
+        )
+    
+    # Load generated content for all projects in one query
+    sections_by_project: Dict[int, List[Dict]] = {project.id: [] for project in projects}
+    for section in (await db.execute(
+        select(Section).where(
+            Section.project_id.in_(project_ids)
+        ).order_by(Section.project_id, Section.index)
+    )).scalars():
+        sections_by_project[section.project_id].append(section.to_dict())
+    
+    empty = [project_id for project_id, sections in sections_by_project.items() if not sections]
+    if empty:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No content has been generated for projects: {sorted(empty)}"
+        )
+    
+    exports = [
+        (
+            f"{project.id}_{_safe_filename(project.topic)}.{project.type}",
+            project.type,
+            project.topic,
+            sections_by_project[project.id]
+        )
+        for project in projects
+    ]
     
     return StreamingResponse(
-        file_stream,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        _zip_stream(exports),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=projects.zip"}
     )
+
+
+def _safe_filename(topic: str) -> str:
+    """
+    File name stem for a project's export
+    
+    Anything but letters, digits, "-", "_" and "." becomes "_", so topics
+    cannot add path separators or ".." to archive entries or break the
+    Content-Disposition header.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", topic).strip("._")
+    return name[:100] or "project"
+
+
+class _ZipSink:
+    """Write-only file object that hands zip output to the response as it is produced"""
+    
+    def __init__(self):
+        self.chunks: List[bytes] = []
+    
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _zip_stream(exports: List[tuple]) -> Iterator[bytes]:
+    """
+    Render exports in parallel and yield a ZIP archive of them in completion order
+    
+    Renders wait for the render pool for at most
+    EXPORT_BULK_RENDER_TIMEOUT_SECONDS in total. A file that could not be
+    rendered is replaced by a "<name>.error.txt" entry saying why, so the
+    download still ends with a valid archive.
+    """
+    sink = _ZipSink()
+    deadline = time.monotonic() + EXPORT_BULK_RENDER_TIMEOUT_SECONDS
+    
+    with ThreadPoolExecutor(max_workers=max(1, render_pool.workers)) as executor, \
+            zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        futures = {
+            executor.submit(_render_with_retry, doc_type, topic, sections, deadline): filename
+            for filename, doc_type, topic, sections in exports
+        }
+        
+        try:
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    path = future.result()
+                except Exception as e:
+                    archive.writestr(f"{filename}.error.txt", f"{filename} could not be exported: {e}\n")
+                    yield sink.drain()
+                    continue
+                
+                # .docx/.pptx files are already compressed, so store them as-is
+                with open(path, "rb") as source, archive.open(filename, "w") as target:
+                    while True:
+                        chunk = source.read(64 * 1024)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+        finally:
+            # The client went away (or a write failed): skip renders not started yet
+            for future in futures:
+                future.cancel()
+    
+    # Remaining entry data and the central directory
+    yield sink.drain()
+
+
+def _render_with_retry(doc_type: str, topic: str, sections: List[Dict], deadline: float) -> str:
+    """
+    Render through the export cache, waiting while the render pool is full
+    
+    Raises:
+        RenderPoolSaturated: If the pool was still full at the deadline
+    """
+    key = export_cache.make_key(doc_type, topic, sections)
+    while True:
+        try:
+            return export_cache.render(key, doc_type, topic, sections)
+        except RenderPoolSaturated:
+            if time.monotonic() + 0.5 > deadline:
+                raise RenderPoolSaturated("the render pool stayed full, please retry later")
+            time.sleep(0.5)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag
+    
+    The header is a comma-separated list of entity tags (or "*"). Tags are
+    compared exactly, ignoring the W/ weak prefix as If-None-Match requires.
+    """
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+async def _export_response(request: Request, doc_type: str, topic: str, sections: List[Dict]) -> Response:
+    """
+    Return the rendered file as a download, reusing the export cache
+    
+    The cache key doubles as the ETag, so clients that already have the
+    current file get 304 Not Modified.
+    """
+    key = export_cache.make_key(doc_type, topic, sections)
+    etag = f'"{key}"'
+    filename = f"{_safe_filename(topic)}.{doc_type}"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "ETag": etag,
+        "Cache-Control": "private, no-cache"
+    }
+    
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # Render (or reuse) the file and return it as downloadable file
+    try:
+        path = await asyncio.to_thread(export_cache.render, key, doc_type, topic, sections)
+    except RenderPoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many exports in progress, please retry shortly",
+            headers={"Retry-After": str(EXPORT_RENDER_RETRY_AFTER_SECONDS)}
+        )
+    
+    return FileResponse(path, media_type=MEDIA_TYPES[doc_type], headers=headers)
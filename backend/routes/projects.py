@@ -1,24 +1,54 @@
 """
 Project management routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-import json
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Any, Dict, List, Optional
+from datetime import datetime
 
-from database.db import get_db
-from models.models import User, Project
-from models.schemas import ProjectCreate, ProjectResponse, ProjectUpdate
-from services.auth import get_current_user
+from database.db import get_async_db
+from models.models import Project, RefinementEvent, Section
+from models.schemas import (
+    ProjectCreate,
+    ProjectResponse,
+    ProjectUpdate,
+    ProjectSummaryPage,
+    RefinementHistoryResponse
+)
+from services.auth import get_current_principal
+from services.principal_cache import Principal
+from services.section_service import section_service
 
 router = APIRouter(prefix="/api/projects", tags=["Projects"])
 
 
+def _project_body(project: Project, sections: List[Section]) -> Dict[str, Any]:
+    """
+    Build a ProjectResponse body directly from the ORM objects
+    
+    Handlers return it in an ORJSONResponse, which skips re-validating
+    and re-encoding the (potentially large) generated content.
+    """
+    return {
+        "id": project.id,
+        "user_id": project.user_id,
+        "type": project.type,
+        "topic": project.topic,
+        "outline": project.outline,
+        "generated_content": [section.to_dict() for section in sections] or None,
+        "created_at": project.created_at,
+        "updated_at": project.updated_at
+    }
+
+
 @router.post("/", response_model=ProjectResponse, status_code=status.HTTP_201_CREATED)
-def create_project(
+async def create_project(
     project_data: ProjectCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new project"""
     # Validate document type
@@ -33,52 +63,104 @@ def create_project(
         user_id=current_user.id,
         type=project_data.type,
         topic=project_data.topic,
-        outline=json.dumps(project_data.outline) if project_data.outline else None,
-        generated_content=None,
-        refinement_history=json.dumps([])
+        outline=project_data.outline or None,
+        generated_content=None
     )
     
     db.add(new_project)
-    db.commit()
-    db.refresh(new_project)
-    
-    # Parse JSON fields for response
-    response_project = new_project
-    response_project.outline = json.loads(new_project.outline) if new_project.outline else None
-    response_project.generated_content = json.loads(new_project.generated_content) if new_project.generated_content else None
-    response_project.refinement_history = json.loads(new_project.refinement_history) if new_project.refinement_history else []
+    await db.commit()
+    await db.refresh(new_project)
     
-    return response_project
+    return ORJSONResponse(_project_body(new_project, []), status_code=status.HTTP_201_CREATED)
 
 
 @router.get("/", response_model=List[ProjectResponse])
-def get_projects(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_projects(
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all projects for current user"""
-    projects = db.query(Project).filter(Project.user_id == current_user.id).all()
+    projects = (await db.execute(
+        select(Project).options(
+            selectinload(Project.sections)
+        ).where(Project.user_id == current_user.id)
+    )).scalars().all()
+    
+    return ORJSONResponse([_project_body(project, project.sections) for project in projects])
+
+
+@router.get("/summaries", response_model=ProjectSummaryPage)
+async def get_project_summaries(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    type: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get a page of project summaries for current user, most recently updated first
     
-    # Parse JSON fields
-    for project in projects:
-        project.outline = json.loads(project.outline) if project.outline else None
-        project.generated_content = json.loads(project.generated_content) if project.generated_content else None
-        project.refinement_history = json.loads(project.refinement_history) if project.refinement_history else []
+    Only summary columns are read, so the cost does not depend on how large
+    the projects are. Pages are keyed on (updated_at, id).
+    """
+    section_count = select(func.count(Section.id)).where(
+        Section.project_id == Project.id
+    ).scalar_subquery()
     
-    return projects
+    query = select(
+        Project.id,
+        Project.type,
+        Project.topic,
+        Project.created_at,
+        Project.updated_at,
+        section_count.label("section_count")
+    ).where(Project.user_id == current_user.id)
+    
+    if type is not None:
+        query = query.where(Project.type == type)
+    
+    if cursor:
+        try:
+            updated_at, project_id = cursor.rsplit(",", 1)
+            updated_at, project_id = datetime.fromisoformat(updated_at), int(project_id)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.where(or_(
+            Project.updated_at < updated_at,
+            and_(Project.updated_at == updated_at, Project.id < project_id)
+        ))
+    
+    # Fetch one extra row to know whether there is another page
+    rows = (await db.execute(
+        query.order_by(Project.updated_at.desc(), Project.id.desc()).limit(limit + 1)
+    )).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = f"{last.updated_at.isoformat()},{last.id}"
+    
+    return {"items": [row._asdict() for row in rows[:limit]], "next_cursor": next_cursor}
 
 
 @router.get("/{project_id}", response_model=ProjectResponse)
-def get_project(
+async def get_project(
     project_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific project"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.user_id == current_user.id
-    ).first()
+    project = (await db.execute(
+        select(Project).options(
+            selectinload(Project.sections)
+        ).where(
+            Project.id == project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not project:
         raise HTTPException(
@@ -86,26 +168,58 @@ def get_project(
             detail="Project not found"
         )
     
-    # Parse JSON fields
-    project.outline = json.loads(project.outline) if project.outline else None
-    project.generated_content = json.loads(project.generated_content) if project.generated_content else None
-    project.refinement_history = json.loads(project.refinement_history) if project.refinement_history else []
+    return ORJSONResponse(_project_body(project, project.sections))
+
+
+@router.get("/{project_id}/history", response_model=RefinementHistoryResponse)
+async def get_project_history(
+    project_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    before_id: Optional[int] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of a project's refinement history, newest first"""
+    project = (await db.execute(
+        select(Project.id).where(
+            Project.id == project_id,
+            Project.user_id == current_user.id
+        )
+    )).first()
     
-    return project
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
+    query = select(RefinementEvent).where(RefinementEvent.project_id == project_id)
+    if before_id is not None:
+        query = query.where(RefinementEvent.id < before_id)
+    
+    # Fetch one extra row to know whether there is another page
+    events = (await db.execute(
+        query.order_by(RefinementEvent.id.desc()).limit(limit + 1)
+    )).scalars().all()
+    next_before_id = events[limit - 1].id if len(events) > limit else None
+    
+    return {"items": events[:limit], "next_before_id": next_before_id}
 
 
 @router.put("/{project_id}", response_model=ProjectResponse)
-def update_project(
+async def update_project(
     project_id: int,
     project_data: ProjectUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a project"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.user_id == current_user.id
-    ).first()
+    project = (await db.execute(
+        select(Project).where(
+            Project.id == project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not project:
         raise HTTPException(
@@ -117,32 +231,32 @@ def update_project(
     if project_data.topic is not None:
         project.topic = project_data.topic
     if project_data.outline is not None:
-        project.outline = json.dumps(project_data.outline)
+        project.outline = project_data.outline
     if project_data.generated_content is not None:
-        project.generated_content = json.dumps(project_data.generated_content)
-    
-    db.commit()
-    db.refresh(project)
+        await db.run_sync(
+            section_service.replace_sections, project.id, project_data.generated_content
+        )
     
-    # Parse JSON fields
-    project.outline = json.loads(project.outline) if project.outline else None
-    project.generated_content = json.loads(project.generated_content) if project.generated_content else None
-    project.refinement_history = json.loads(project.refinement_history) if project.refinement_history else []
+    await db.commit()
+    await db.refresh(project)
+    await db.refresh(project, ["sections"])
     
-    return project
+    return ORJSONResponse(_project_body(project, project.sections))
 
 
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_project(
+async def delete_project(
     project_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a project"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.user_id == current_user.id
-    ).first()
+    project = (await db.execute(
+        select(Project).where(
+            Project.id == project_id,
+            Project.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not project:
         raise HTTPException(
@@ -150,7 +264,7 @@ def delete_project(
             detail="Project not found"
         )
     
-    db.delete(project)
-    db.commit()
+    await db.delete(project)
+    await db.commit()
     
     return None
@@ -2,20 +2,28 @@
 Authentication utilities for JWT token handling
 """
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from database.db import get_db
+from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS
+from database.db import get_async_db
 from models.models import User
 from models.schemas import TokenData
+from services.principal_cache import Principal, principal_cache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; hashes with any other cost factor are flagged for rehashing
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -37,6 +45,28 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(truncated_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and rehash it if its hash uses an outdated cost factor
+    
+    Args:
+        plain_password: Password to check
+        hashed_password: Stored hash
+    
+    Returns:
+        Tuple of (valid, new hash or None if the stored hash is current)
+    """
+    # Truncate to 72 bytes for bcrypt compatibility
+    password_bytes = plain_password.encode('utf-8')[:72]
+    truncated_password = password_bytes.decode('utf-8', errors='ignore')
+    return pwd_context.verify_and_update(truncated_password, hashed_password)
+
+
+def warm_password_worker():
+    """Process pool initializer; loads the bcrypt backend"""
+    pwd_context.handler("bcrypt").get_backend()
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -50,11 +80,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(
+async def get_current_principal(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user from JWT token"""
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Get the authenticated principal from a JWT token, using the principal cache"""
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -70,8 +104,40 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == token_data.username).first()
-    if user is None:
+    query = select(User.id, User.username)
+    user_id = payload.get("uid")
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    else:
+        # Tokens issued before the user id was added to the claims
+        query = query.where(User.username == token_data.username)
+    row = (await db.execute(query)).first()
+    if row is None or row.username != token_data.username:
         raise credentials_exception
     
+    principal = Principal(id=row.id, username=row.username)
+    principal_cache.set(token, principal, payload["exp"])
+    return principal
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Get the full current user row (for handlers that need more than the id)"""
+    user = await db.get(User, principal.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
     return user
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_principal(mapper, connection, target: User):
+    """Drop cached tokens of a user whose row changed"""
+    principal_cache.invalidate_user(target.id)
@@ -0,0 +1,144 @@
+"""
+Disk cache for rendered .docx and .pptx exports
+
+Files are keyed by a hash of the format, topic, section titles/content,
+the export template version and the renderer (engine and library
+versions), so any change to what ends up in the file produces a new key. The directory is bounded in size and evicts the least
+recently used files first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_MB
+from database.db import SessionLocal
+from models.models import Project
+from services.export_service import EXPORT_RENDERER, EXPORT_TEMPLATE_VERSION
+from services.metrics import record_cache_lookup
+from services.render_pool import render_pool
+from services.section_service import section_service
+
+
+class ExportCache:
+    """Size-bounded LRU cache of rendered export files"""
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_bytes: int = EXPORT_CACHE_MAX_MB * 1024 * 1024):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Directory holding the cached files
+            max_bytes: Total size the directory is trimmed back to after a write
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(doc_type: str, topic: str, sections: List[Dict]) -> str:
+        """Hash everything that affects the rendered file into a cache key"""
+        payload = json.dumps({
+            "version": EXPORT_TEMPLATE_VERSION,
+            "renderer": EXPORT_RENDERER,
+            "type": doc_type,
+            "topic": topic,
+            "sections": [[s.get("title"), s.get("content")] for s in sections]
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, doc_type: str) -> Optional[str]:
+        """Return the path of a cached file, or None on a miss"""
+        path = self._path(key, doc_type)
+        try:
+            # Access time drives LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            record_cache_lookup("export", "miss")
+            return None
+        record_cache_lookup("export", "hit")
+        return path
+
+    def render(self, key: str, doc_type: str, topic: str, sections: List[Dict]) -> str:
+        """
+        Return the path of the rendered file, rendering it on a miss
+
+        Args:
+            key: Cache key from make_key
+            doc_type: Either "docx" or "pptx"
+            topic: Document topic/title
+            sections: List of dicts with 'title' and 'content' keys
+
+        Returns:
+            Path of the cached file
+
+        Raises:
+            RenderPoolSaturated: If the render pool is full
+        """
+        path = self.get(key, doc_type)
+        if path:
+            return path
+
+        # Render to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            render_pool.render_to_file(doc_type, topic, sections, tmp_path)
+            path = self._path(key, doc_type)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._evict()
+        return path
+
+    def prerender(self, doc_type: str, topic: str, sections: List[Dict]):
+        """Render and cache an export ahead of the first download"""
+        if not sections:
+            return
+        try:
+            self.render(self.make_key(doc_type, topic, sections), doc_type, topic, sections)
+        except Exception as e:
+            print(f"Error pre-rendering export: {e}")
+
+    def prerender_project(self, project_id: int):
+        """Render and cache the current export of a project (for background tasks)"""
+        db = SessionLocal()
+        try:
+            project = db.query(Project.type, Project.topic).filter(Project.id == project_id).first()
+            if project:
+                sections = section_service.get_sections(db, project_id)
+                self.prerender(project.type, project.topic, sections)
+        finally:
+            db.close()
+
+    def _path(self, key: str, doc_type: str) -> str:
+        """Path of the cached file for a key"""
+        return os.path.join(self.directory, f"{key}.{doc_type}")
+
+    def _evict(self):
+        """Delete least recently used files until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+# Global export cache instance
+export_cache = ExportCache()
@@ -1,14 +1,34 @@
 """
 Document export service for generating .docx and .pptx files
 """
+import docx
+import pptx
 from docx import Document
 from docx.shared import Pt, Inches
 from pptx import Presentation
 from pptx.util import Inches as PptxInches, Pt as PptxPt
 from typing import List, Dict
+from functools import lru_cache
 import json
 from io import BytesIO
 
+from config import EXPORT_ENGINE
+from services.fast_export import (
+    FastDocxWriter, FastPptxWriter, is_supported, FAST_EXPORT_VERSION,
+    TOPIC, DOCX_REFERENCE_SECTIONS, PPTX_REFERENCE_SLIDES
+)
+
+# Bump whenever the rendered output changes so cached exports are not reused
+EXPORT_TEMPLATE_VERSION = "1"
+
+# Engine and library versions that rendered a file; part of export cache
+# keys, so switching EXPORT_ENGINE or upgrading a renderer re-renders
+EXPORT_RENDERER = "/".join([
+    f"fast-{FAST_EXPORT_VERSION}" if EXPORT_ENGINE == "fast" else "standard",
+    f"python-docx-{docx.__version__}",
+    f"python-pptx-{pptx.__version__}"
+])
+
 
 class ExportService:
     """Service for exporting documents to .docx and .pptx formats"""
@@ -25,6 +45,16 @@ class ExportService:
         Returns:
             BytesIO object containing the .docx file
         """
+        if EXPORT_ENGINE == "fast" and is_supported(topic, sections):
+            file_stream = BytesIO()
+            fast_docx_writer().write(file_stream, topic, sections)
+            file_stream.seek(0)
+            return file_stream
+        return ExportService._export_docx_standard(topic, sections)
+    
+    @staticmethod
+    def _export_docx_standard(topic: str, sections: List[Dict[str, str]]) -> BytesIO:
+        """Build a Word document with python-docx"""
         doc = Document()
         
         # Add title
@@ -65,6 +95,16 @@ class ExportService:
         Returns:
             BytesIO object containing the .pptx file
         """
+        if EXPORT_ENGINE == "fast" and is_supported(topic, slides):
+            file_stream = BytesIO()
+            fast_pptx_writer().write(file_stream, topic, slides)
+            file_stream.seek(0)
+            return file_stream
+        return ExportService._export_pptx_standard(topic, slides)
+    
+    @staticmethod
+    def _export_pptx_standard(topic: str, slides: List[Dict[str, str]]) -> BytesIO:
+        """Build a PowerPoint presentation with python-pptx"""
         prs = Presentation()
         prs.slide_width = PptxInches(10)
         prs.slide_height = PptxInches(7.5)
@@ -112,3 +152,45 @@ class ExportService:
 
 # Global export service instance
 export_service = ExportService()
+
+
+@lru_cache(maxsize=None)
+def fast_docx_writer() -> FastDocxWriter:
+    """Fast .docx writer, built once per process from a standard-engine reference"""
+    reference = ExportService._export_docx_standard(TOPIC, DOCX_REFERENCE_SECTIONS)
+    return FastDocxWriter(reference.getvalue())
+
+
+@lru_cache(maxsize=None)
+def fast_pptx_writer() -> FastPptxWriter:
+    """Fast .pptx writer, built once per process from a standard-engine reference"""
+    reference = ExportService._export_pptx_standard(TOPIC, PPTX_REFERENCE_SLIDES)
+    return FastPptxWriter(reference.getvalue())
+
+
+def warm_render_worker():
+    """Process pool initializer; python-docx/python-pptx are imported with this module"""
+    Document()
+    Presentation()
+    if EXPORT_ENGINE == "fast":
+        fast_docx_writer()
+        fast_pptx_writer()
+
+
+def render_export_file(doc_type: str, topic: str, sections: List[Dict[str, str]], path: str):
+    """
+    Render an export straight to a file (runs inside render pool workers)
+    
+    Args:
+        doc_type: Either "docx" or "pptx"
+        topic: Document topic/title
+        sections: List of dicts with 'title' and 'content' keys
+        path: File to write
+    """
+    if doc_type == "docx":
+        file_stream = export_service.export_docx(topic=topic, sections=sections)
+    else:
+        file_stream = export_service.export_pptx(topic=topic, slides=sections)
+    
+    with open(path, "wb") as f:
+        f.write(file_stream.getbuffer())
@@ -0,0 +1,389 @@
+"""
+Template-based writers for .docx and .pptx exports
+
+python-docx and python-pptx build an object per paragraph and re-serialize
+every part of the package on save. These writers instead take a reference
+package rendered once by the standard engine with sentinel text, cut it into
+XML fragments, and render new exports by string concatenation: the body XML
+is fed to the compressor in chunks and every other part of the package is
+copied as pre-compressed bytes. The output matches the standard engine part
+for part.
+"""
+import re
+import struct
+import time
+import zlib
+import zipfile
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
+from xml.sax.saxutils import escape
+
+# Bump whenever the writers' output changes so cached exports are not reused
+FAST_EXPORT_VERSION = "1"
+
+# Sentinel text used when rendering the reference packages
+TOPIC = "@@TOPIC@@"
+DOCX_REFERENCE_SECTIONS = [{"title": "@@T0@@", "content": "@@C0@@"}]
+PPTX_REFERENCE_SLIDES = [
+    {"title": "@@T0@@", "content": "@@A0@@\n@@A1@@"},
+    {"title": "@@T1@@", "content": " \n@@B1@@"},
+    {"title": "@@T2@@", "content": ""},
+]
+
+# Text the writers do not reproduce exactly (line breaks, tabs and control
+# characters inside a run); exports containing it use the standard engine
+_UNSUPPORTED_TEXT = re.compile(r"[\x00-\x1f]")
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def is_supported(topic: str, sections: List[Dict[str, str]]) -> bool:
+    """Return True if the fast writers can render this export exactly"""
+    if not isinstance(topic, str) or _UNSUPPORTED_TEXT.search(topic):
+        return False
+    for section in sections:
+        title = section.get("title")
+        if not isinstance(title, str) or _UNSUPPORTED_TEXT.search(title):
+            return False
+        content = section.get("content") or ""
+        if not isinstance(content, str):
+            return False
+        for line in content.split("\n"):
+            if _UNSUPPORTED_TEXT.search(line.strip()):
+                return False
+    return True
+
+
+def _content_lines(content: str) -> Iterator[str]:
+    """Non-blank, stripped lines of a section's content"""
+    for line in content.split("\n"):
+        if line.strip():
+            yield line.strip()
+
+
+def _between(xml: str, start: int, end_marker: str) -> int:
+    """Index just past the first end_marker at or after start"""
+    return xml.index(end_marker, start) + len(end_marker)
+
+
+class _ZipWriter:
+    """Minimal ZIP writer for pre-compressed and streamed DEFLATE entries"""
+
+    def __init__(self, out: BinaryIO):
+        """
+        Initialize the writer
+
+        Args:
+            out: Binary stream the archive is written to
+        """
+        self.out = out
+        self.offset = 0
+        self.entries: List[Tuple[bytes, int, int, int, int]] = []
+        now = time.localtime()
+        self.dos_time = now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+        self.dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+
+    @staticmethod
+    def compress(chunks: Iterable[str]) -> Tuple[List[bytes], int, int, int]:
+        """
+        Deflate text chunks as they are produced
+
+        Returns:
+            Compressed chunks, CRC-32, compressed size and uncompressed size
+        """
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        parts: List[bytes] = []
+        crc = size = 0
+        pending: List[str] = []
+        pending_len = 0
+
+        def flush():
+            nonlocal crc, size
+            data = "".join(pending).encode("utf-8")
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            parts.append(compressor.compress(data))
+            pending.clear()
+
+        for chunk in chunks:
+            pending.append(chunk)
+            pending_len += len(chunk)
+            if pending_len >= _CHUNK_SIZE:
+                flush()
+                pending_len = 0
+        flush()
+        parts.append(compressor.flush())
+        return parts, crc, sum(len(part) for part in parts), size
+
+    def add(self, name: str, parts: List[bytes], crc: int, compressed_size: int, size: int):
+        """Write one DEFLATE entry whose compressed data is already known"""
+        encoded_name = name.encode("ascii")
+        header = struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 20, 0, zipfile.ZIP_DEFLATED,
+            self.dos_time, self.dos_date, crc, compressed_size, size, len(encoded_name), 0
+        )
+        self.entries.append((encoded_name, crc, compressed_size, size, self.offset))
+        self._write(header + encoded_name)
+        for part in parts:
+            self._write(part)
+
+    def close(self):
+        """Write the central directory"""
+        directory_offset = self.offset
+        for name, crc, compressed_size, size, offset in self.entries:
+            record = struct.pack(
+                "<IBBHHHHHIIIHHHHHII", 0x02014B50, 20, 3, 20, 0, zipfile.ZIP_DEFLATED,
+                self.dos_time, self.dos_date, crc, compressed_size, size,
+                len(name), 0, 0, 0, 0, 0o600 << 16, offset
+            )
+            self._write(record + name)
+        self._write(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, len(self.entries), len(self.entries),
+            self.offset - directory_offset, directory_offset, 0
+        ))
+
+    def _write(self, data: bytes):
+        """Write raw bytes and track the archive offset"""
+        self.out.write(data)
+        self.offset += len(data)
+
+
+class _Package:
+    """Parts of a reference package, kept both as text and pre-compressed"""
+
+    def __init__(self, reference: bytes):
+        """
+        Read a reference package
+
+        Args:
+            reference: Package bytes rendered by the standard engine
+        """
+        self.names: List[str] = []
+        self.xml: Dict[str, str] = {}
+        self.compressed: Dict[str, tuple] = {}
+        with zipfile.ZipFile(BytesIO(reference)) as archive:
+            for info in archive.infolist():
+                data = archive.read(info)
+                self.names.append(info.filename)
+                if info.filename.endswith((".xml", ".rels")):
+                    self.xml[info.filename] = data.decode("utf-8")
+                self.compressed[info.filename] = self._compress_bytes(data)
+
+    @staticmethod
+    def _compress_bytes(data: bytes) -> tuple:
+        """Deflate a static part once"""
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        return [compressed], zlib.crc32(data), len(compressed), len(data)
+
+
+class FastDocxWriter:
+    """Renders .docx files from a reference package"""
+
+    def __init__(self, reference: bytes):
+        """
+        Cut the reference package into fragments
+
+        Args:
+            reference: .docx rendered by the standard engine from TOPIC and
+                DOCX_REFERENCE_SECTIONS
+        """
+        self.package = _Package(reference)
+        xml = self.package.xml["word/document.xml"]
+        body_start = _between(xml, 0, "<w:body>")
+        self.head = xml[:body_start]
+        self.tail = xml[xml.index("<w:sectPr"):]
+        self.title = self._paragraph(xml, TOPIC)
+        self.heading = self._paragraph(xml, "@@T0@@")
+        self.paragraph = self._paragraph(xml, "@@C0@@")
+
+    @staticmethod
+    def _paragraph(xml: str, sentinel: str) -> Tuple[str, str]:
+        """Split the paragraph holding a sentinel into the XML around its run"""
+        position = xml.index(f"<w:r><w:t>{sentinel}</w:t></w:r>")
+        start = xml.rindex("<w:p>", 0, position)
+        run_end = _between(xml, position, "</w:r>")
+        return xml[start:position], xml[run_end:_between(xml, run_end, "</w:p>")]
+
+    @staticmethod
+    def _run(text: str) -> str:
+        """Run XML for text, as python-docx writes it"""
+        if not text:
+            return ""
+        space = ' xml:space="preserve"' if text.strip() != text else ""
+        return f"<w:r><w:t{space}>{escape(text)}</w:t></w:r>"
+
+    def _body(self, topic: str, sections: List[Dict[str, str]]) -> Iterator[str]:
+        """Yield document.xml in chunks"""
+        yield self.head
+        yield self.title[0] + self._run(topic) + self.title[1]
+        for section in sections:
+            yield self.heading[0] + self._run(section["title"]) + self.heading[1]
+            for line in _content_lines(section.get("content") or ""):
+                yield self.paragraph[0] + self._run(line) + self.paragraph[1]
+        yield self.tail
+
+    def write(self, out: BinaryIO, topic: str, sections: List[Dict[str, str]]):
+        """
+        Write a .docx file
+
+        Args:
+            out: Binary stream to write to
+            topic: Document topic/title
+            sections: List of dicts with 'title' and 'content' keys
+        """
+        writer = _ZipWriter(out)
+        for name in self.package.names:
+            if name == "word/document.xml":
+                writer.add(name, *writer.compress(self._body(topic, sections)))
+            else:
+                writer.add(name, *self.package.compressed[name])
+        writer.close()
+
+
+class FastPptxWriter:
+    """Renders .pptx files from a reference package"""
+
+    _SLIDE_PART = re.compile(r"ppt/slides/(_rels/)?slide\d+\.xml(\.rels)?$")
+    _SLIDE_OVERRIDE = re.compile(r'<Override PartName="/ppt/slides/slide\d+\.xml"[^>]*/>')
+    _SLIDE_RELATIONSHIP = re.compile(r'<Relationship Id="rId(\d+)" Type="[^"]*/slide" Target="slides/slide\d+\.xml"/>')
+    _PART_NAME = re.compile(r'PartName="([^"]+)"')
+
+    def __init__(self, reference: bytes):
+        """
+        Cut the reference package into fragments
+
+        Args:
+            reference: .pptx rendered by the standard engine from TOPIC and
+                PPTX_REFERENCE_SLIDES
+        """
+        self.package = _Package(reference)
+        xml = self.package.xml
+
+        # Package-level parts that list the slides
+        content_types = xml["[Content_Types].xml"]
+        self.slide_override = self._SLIDE_OVERRIDE.findall(content_types)[0].replace("slide1.xml", "slide{n}.xml")
+        overrides_start = content_types.index("<Override")
+        self.types_head = content_types[:overrides_start]
+        self.types_tail = content_types[content_types.rindex("/>") + 2:]
+        self.overrides = [
+            override for override in re.findall(r"<Override [^>]*/>", content_types)
+            if not self._SLIDE_OVERRIDE.match(override)
+        ]
+
+        rels = xml["ppt/_rels/presentation.xml.rels"]
+        slide_rels = list(self._SLIDE_RELATIONSHIP.finditer(rels))
+        self.first_slide_rid = int(slide_rels[0].group(1))
+        self.slide_relationship = slide_rels[0].group(0).replace(
+            f'rId{self.first_slide_rid}"', 'rId{rid}"'
+        ).replace("slide1.xml", "slide{n}.xml")
+        self.rels = self._SLIDE_RELATIONSHIP.sub("", rels)
+
+        presentation = xml["ppt/presentation.xml"]
+        slide_ids = re.search(r"<p:sldIdLst>.*?</p:sldIdLst>", presentation)
+        self.first_slide_id = int(re.search(r'<p:sldId id="(\d+)"', slide_ids.group(0)).group(1))
+        self.presentation = (presentation[:slide_ids.start()], presentation[slide_ids.end():])
+
+        # Slide parts
+        self.title_slide = self._split(xml["ppt/slides/slide1.xml"], TOPIC)
+        self.title_slide_rels = self.package.compressed["ppt/slides/_rels/slide1.xml.rels"]
+        self.content_slide_rels = self.package.compressed["ppt/slides/_rels/slide2.xml.rels"]
+
+        slide = xml["ppt/slides/slide2.xml"]
+        self.slide_head, rest = self._split(slide, "@@T0@@")
+        first = rest.index("<a:p><a:r><a:t>@@A0@@")
+        self.slide_middle = rest[:first]
+        first_end = _between(rest, first, "</a:p>")
+        self.first_line = rest[first:first_end].split("@@A0@@")
+        second_end = _between(rest, first_end, "</a:p>")
+        self.next_line = rest[first_end:second_end].split("@@A1@@")
+        self.slide_tail = rest[second_end:]
+
+        blank_first = xml["ppt/slides/slide3.xml"]
+        blank_start = _between(blank_first, 0, "<a:t>@@T1@@</a:t></a:r></a:p>") + len(self.slide_middle)
+        self.blank_first_line = blank_first[blank_start:blank_first.index("<a:p>", blank_start)]
+
+        empty = xml["ppt/slides/slide4.xml"]
+        empty_start = _between(empty, 0, "<a:t>@@T2@@</a:t></a:r></a:p>") + len(self.slide_middle)
+        self.empty_body = empty[empty_start:len(empty) - len(self.slide_tail)]
+
+    @staticmethod
+    def _split(xml: str, sentinel: str) -> Tuple[str, str]:
+        """Split slide XML around the paragraph holding a single-run sentinel"""
+        paragraph = f"<a:p><a:r><a:t>{sentinel}</a:t></a:r></a:p>"
+        position = xml.index(paragraph)
+        return xml[:position], xml[position + len(paragraph):]
+
+    @staticmethod
+    def _single_run(text: str) -> str:
+        """Paragraph XML for a title, as python-pptx writes it"""
+        if not text:
+            return "<a:p/>"
+        return f"<a:p><a:r><a:t>{escape(text)}</a:t></a:r></a:p>"
+
+    def _content_slide(self, slide: Dict[str, str]) -> Iterator[str]:
+        """Yield the XML of one content slide"""
+        yield self.slide_head
+        yield self._single_run(slide["title"])
+        yield self.slide_middle
+
+        content = slide.get("content") or ""
+        if not content:
+            yield self.empty_body
+        else:
+            lines = content.split("\n")
+            first = lines[0].strip()
+            if first:
+                yield self.first_line[0] + escape(first) + self.first_line[1]
+            else:
+                yield self.blank_first_line
+            for line in _content_lines("\n".join(lines[1:])):
+                yield self.next_line[0] + escape(line) + self.next_line[1]
+        yield self.slide_tail
+
+    def write(self, out: BinaryIO, topic: str, slides: List[Dict[str, str]]):
+        """
+        Write a .pptx file
+
+        Args:
+            out: Binary stream to write to
+            topic: Presentation topic/title
+            slides: List of dicts with 'title' and 'content' keys
+        """
+        count = len(slides) + 1
+        writer = _ZipWriter(out)
+        for name in self.package.names:
+            if name == "[Content_Types].xml":
+                overrides = self.overrides + [self.slide_override.format(n=n) for n in range(1, count + 1)]
+                overrides.sort(key=lambda override: self._PART_NAME.search(override).group(1))
+                writer.add(name, *writer.compress([self.types_head, *overrides, self.types_tail]))
+            elif name == "ppt/_rels/presentation.xml.rels":
+                closing = self.rels.rindex("</Relationships>")
+                writer.add(name, *writer.compress([
+                    self.rels[:closing],
+                    *(self.slide_relationship.format(rid=self.first_slide_rid + k, n=k + 1) for k in range(count)),
+                    self.rels[closing:]
+                ]))
+            elif name == "ppt/presentation.xml":
+                first_rid = self.first_slide_rid
+                writer.add(name, *writer.compress([
+                    self.presentation[0],
+                    "<p:sldIdLst>",
+                    *(f'<p:sldId id="{self.first_slide_id + k}" r:id="rId{first_rid + k}"/>' for k in range(count)),
+                    "</p:sldIdLst>",
+                    self.presentation[1]
+                ]))
+            elif name == "ppt/slides/slide1.xml":
+                self._write_slides(writer, topic, slides)
+            elif not self._SLIDE_PART.match(name):
+                writer.add(name, *self.package.compressed[name])
+        writer.close()
+
+    def _write_slides(self, writer: _ZipWriter, topic: str, slides: List[Dict[str, str]]):
+        """Write every slide part and its relationships"""
+        title = self.title_slide[0] + self._single_run(topic) + self.title_slide[1]
+        writer.add("ppt/slides/slide1.xml", *writer.compress([title]))
+        writer.add("ppt/slides/_rels/slide1.xml.rels", *self.title_slide_rels)
+        for n, slide in enumerate(slides, start=2):
+            writer.add(f"ppt/slides/slide{n}.xml", *writer.compress(self._content_slide(slide)))
+            writer.add(f"ppt/slides/_rels/slide{n}.xml.rels", *self.content_slide_rels)
@@ -0,0 +1,180 @@
+"""
+Idempotency-Key support for generate and refine
+
+A client that sends an Idempotency-Key header can retry the request (after
+a timeout, a dropped connection or a double click) without the work being
+done twice. The first request claims the key; once it succeeds its response
+is stored and replayed to every later request with the same key for
+IDEMPOTENCY_TTL_SECONDS. Keys are scoped to the user.
+
+A repeat that arrives while the first request is still running gets 409,
+and reusing a key for a different request gets 422. A request that fails
+releases its key, so the client can retry it with the same key.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config import IDEMPOTENCY_TTL_SECONDS
+from database.db import AsyncSessionLocal
+from models.models import IdempotencyRecord
+from services.metrics import idempotent_replays
+
+MAX_KEY_LENGTH = 255
+# A claim this old belongs to a request that never finished (e.g. its
+# worker was killed) and may be taken over
+ABANDONED_AFTER_SECONDS = 600
+
+
+class IdempotencyStore:
+    """Claims Idempotency-Keys and stores the responses of their requests"""
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS):
+        """
+        Initialize the store
+
+        Args:
+            ttl_seconds: How long a stored response is replayed
+        """
+        self.ttl_seconds = ttl_seconds
+
+    async def run(
+        self,
+        user_id: int,
+        key: Optional[str],
+        operation: str,
+        payload: Dict[str, Any],
+        response: Response,
+        handler: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Handle a request at most once per Idempotency-Key
+
+        Args:
+            user_id: The requesting user
+            key: The Idempotency-Key header (None just runs the handler)
+            operation: Route label ("generate", "refine", ...)
+            payload: Request body; a repeat must send the same one
+            response: The route's response, for the status code
+            handler: Handles the request and returns the response body
+
+        Returns:
+            The handler's response body, or the stored one for a repeat
+
+        Raises:
+            HTTPException: 400 for a malformed key, 409 while the first
+                request is running, 422 if the key was used for another request
+        """
+        if key is None:
+            return await handler()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+            )
+
+        fingerprint = hashlib.sha256(
+            operation.encode("utf-8") + b"\0" + orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+        record = await self._claim(user_id, key, operation, fingerprint)
+        if record is not None:
+            idempotent_replays.labels(operation).inc()
+            response.status_code = record.status_code
+            response.headers["Idempotent-Replayed"] = "true"
+            return record.response
+
+        try:
+            body = jsonable_encoder(await handler())
+        except BaseException:
+            # Nothing was done (or it failed): let the client retry with the same key
+            await self._release(user_id, key)
+            raise
+        await self._store(user_id, key, response.status_code or status.HTTP_200_OK, body)
+        return body
+
+    async def _claim(self, user_id: int, key: str, operation: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+        """Claim the key, or return the finished record of an earlier request"""
+        for _ in range(3):
+            now = datetime.utcnow()
+            async with AsyncSessionLocal() as db:
+                # Expired records are dropped as their user makes new requests
+                await db.execute(delete(IdempotencyRecord).where(
+                    IdempotencyRecord.user_id == user_id,
+                    IdempotencyRecord.created_at < now - timedelta(seconds=self.ttl_seconds)
+                ))
+                db.add(IdempotencyRecord(
+                    user_id=user_id,
+                    key=key,
+                    operation=operation,
+                    fingerprint=fingerprint,
+                    created_at=now
+                ))
+                try:
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()
+
+                record = (await db.execute(select(IdempotencyRecord).where(
+                    IdempotencyRecord.user_id == user_id,
+                    IdempotencyRecord.key == key
+                ))).scalars().first()
+                if record is None:
+                    # Released in the meantime; claim it again
+                    continue
+
+                if record.fingerprint != fingerprint:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail="Idempotency-Key was already used for a different request"
+                    )
+                if record.status_code is not None:
+                    return record
+
+                if record.created_at < now - timedelta(seconds=ABANDONED_AFTER_SECONDS):
+                    # Take over an abandoned claim, unless another request just did
+                    result = await db.execute(
+                        update(IdempotencyRecord)
+                        .where(IdempotencyRecord.id == record.id, IdempotencyRecord.created_at == record.created_at)
+                        .values(created_at=now)
+                    )
+                    await db.commit()
+                    if result.rowcount == 1:
+                        return None
+                break
+
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "5"}
+        )
+
+    async def _store(self, user_id: int, key: str, status_code: int, body: Dict[str, Any]):
+        """Save the response of a finished request"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key)
+                .values(status_code=status_code, response=body)
+            )
+            await db.commit()
+
+    async def _release(self, user_id: int, key: str):
+        """Drop an unfinished claim"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(IdempotencyRecord).where(
+                IdempotencyRecord.user_id == user_id,
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code.is_(None)
+            ))
+            await db.commit()
+
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore()
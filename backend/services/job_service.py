@@ -0,0 +1,322 @@
+"""
+Background job service for content generation
+
+Jobs live in the generation_jobs table, which doubles as the queue: every
+worker process claims queued jobs with a conditional UPDATE, so several
+gunicorn workers can share one database without running a job twice.
+Finished sections are saved on the job as they arrive, and a job that fails
+or is interrupted resumes from the sections that were not finished.
+
+A running job carries its worker's claim token and a heartbeat keeps its
+updated_at fresh. A job whose worker died stops beating and is requeued
+after JOB_STALE_SECONDS; every write the old worker might still attempt
+requires its token, so it cannot overwrite the job once another worker
+took it over.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, joinedload
+
+from ai.ai_service import ai_service
+from ai.scheduler import llm_caller
+from config import JOB_WORKERS, JOB_POLL_INTERVAL_SECONDS, JOB_STALE_SECONDS, EXPORT_PRERENDER
+from database.db import SessionLocal
+from models.models import GenerationJob, Project
+from services.export_cache import export_cache
+from services.section_service import section_service
+
+# How often a running job's updated_at is bumped; well within JOB_STALE_SECONDS
+HEARTBEAT_SECONDS = max(1.0, JOB_STALE_SECONDS / 5)
+
+
+class JobService:
+    """In-process worker pool for background generation jobs"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        """Initialize the job service"""
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def enqueue(self, db: Session, project: Project, mode: Optional[str] = None) -> GenerationJob:
+        """
+        Create a generation job for a project, or return its active one
+
+        Args:
+            db: Database session
+            project: Project whose outline should be generated
+            mode: "concurrent" or "sequential"
+
+        Returns:
+            The queued or running job
+        """
+        job = db.query(GenerationJob).filter(
+            GenerationJob.project_id == project.id,
+            GenerationJob.status.in_(["queued", "running"])
+        ).first()
+        if job:
+            return job
+
+        outline = project.outline or []
+        job = GenerationJob(
+            project_id=project.id,
+            user_id=project.user_id,
+            status="queued",
+            mode=mode,
+            total_sections=len(outline),
+            completed_sections=0,
+            sections={}
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        self.notify()
+        return job
+
+    def resume(self, db: Session, job: GenerationJob) -> GenerationJob:
+        """Requeue a failed job; finished sections are kept"""
+        if job.status == "failed":
+            job.status = "queued"
+            job.error = None
+            db.commit()
+            db.refresh(job)
+            self.notify()
+        return job
+
+    def notify(self):
+        """Wake idle workers in this process after a job is queued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Start the worker pool on the running event loop"""
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the worker pool; running jobs are requeued"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        """Claim and run queued jobs until cancelled"""
+        while True:
+            try:
+                # A claim can wait on SQLite's write lock; keep it off the event loop
+                claim = await asyncio.to_thread(self._claim_next)
+            except Exception as e:
+                print(f"Error claiming generation job: {e}")
+                claim = None
+
+            if claim is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.run(*claim)
+
+    def _claim_next(self) -> Optional[Tuple[int, str]]:
+        """Atomically move the oldest queued job to running; returns its id and claim token"""
+        db = SessionLocal()
+        try:
+            # Jobs whose worker died stop making progress; put them back in the queue
+            stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+            db.query(GenerationJob).filter(
+                GenerationJob.status == "running",
+                GenerationJob.updated_at < stale_before
+            ).update({"status": "queued", "claim_token": None}, synchronize_session=False)
+            db.commit()
+
+            candidates = db.query(GenerationJob.id).filter(
+                GenerationJob.status == "queued"
+            ).order_by(GenerationJob.created_at).limit(5).all()
+
+            for (job_id,) in candidates:
+                token = uuid.uuid4().hex
+                claimed = db.query(GenerationJob).filter(
+                    GenerationJob.id == job_id,
+                    GenerationJob.status == "queued"
+                ).update(
+                    {"status": "running", "claim_token": token, "updated_at": datetime.utcnow()},
+                    synchronize_session=False
+                )
+                db.commit()
+                if claimed:
+                    return job_id, token
+            return None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _load(db: Session, job_id: int) -> Optional[GenerationJob]:
+        """Load a job together with its project"""
+        return db.query(GenerationJob).options(
+            joinedload(GenerationJob.project)
+        ).filter(GenerationJob.id == job_id).first()
+
+    @staticmethod
+    def _update_claimed(db: Session, job_id: int, token: str, values: Dict[str, Any], commit: bool = True) -> bool:
+        """
+        Update a job only while this worker still holds its claim
+
+        Args:
+            db: Database session
+            job_id: Job to update
+            token: Claim token the worker got from _claim_next
+            values: Columns to set (updated_at is always bumped)
+            commit: Commit the update (otherwise the caller does)
+
+        Returns:
+            False if the job was requeued or claimed by another worker
+        """
+        updated = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == "running",
+            GenerationJob.claim_token == token
+        ).update({**values, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        if commit:
+            db.commit()
+        return updated == 1
+
+    def _touch(self, job_id: int, token: str) -> bool:
+        """Heartbeat: bump a running job's updated_at in a session of its own"""
+        db = SessionLocal()
+        try:
+            return self._update_claimed(db, job_id, token, {})
+        finally:
+            db.close()
+
+    async def _heartbeat(self, job_id: int, token: str, generation: asyncio.Task):
+        """Keep a running job from looking stale; stop its generation if the claim was lost"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                owned = await asyncio.to_thread(self._touch, job_id, token)
+            except Exception as e:
+                print(f"Error updating generation job {job_id} heartbeat: {e}")
+                continue
+            if not owned:
+                print(f"Generation job {job_id} was taken over by another worker")
+                generation.cancel()
+                return
+
+    async def run(self, job_id: int, token: str):
+        """
+        Generate the unfinished sections of a claimed job
+
+        Args:
+            job_id: ID of a job in the "running" state
+            token: Claim token the worker got from _claim_next
+        """
+        generation = asyncio.create_task(self._generate(job_id, token))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, token, generation))
+        try:
+            # wait() returns (rather than raises) when the heartbeat cancels the generation
+            await asyncio.wait([generation])
+        except asyncio.CancelledError:
+            # Shutting down: let the generation requeue the job first
+            generation.cancel()
+            await asyncio.wait([generation])
+            raise
+        finally:
+            heartbeat.cancel()
+
+        if not generation.cancelled() and generation.exception() is not None:
+            print(f"Error running generation job {job_id}: {generation.exception()}")
+
+    async def _generate(self, job_id: int, token: str):
+        """Generate a claimed job's sections, saving each one while the claim holds"""
+        db = SessionLocal()
+        try:
+            # Database calls run in threads: waiting on a write lock held by
+            # a request must not block the event loop that request needs
+            job = await asyncio.to_thread(self._load, db, job_id)
+            if job is None:
+                return
+            project = job.project
+            if project is None:
+                # Fail it for good rather than leave it to the stale-claim sweep
+                await asyncio.to_thread(self._update_claimed, db, job_id, token, {
+                    "status": "failed",
+                    "error": "Project was deleted",
+                    "claim_token": None
+                })
+                return
+
+            project_id = project.id
+            topic, doc_type, mode = project.topic, project.type, job.mode
+            # Queue the job's model calls fairly against its owner's other calls
+            llm_caller.set(project.user_id)
+            outline = project.outline or []
+
+            # Keep finished sections that still match the outline
+            finished = {}
+            for key, section in (job.sections or {}).items():
+                i = int(key)
+                if i < len(outline) and section["title"] == outline[i]:
+                    finished[i] = section
+
+            if not await asyncio.to_thread(self._update_claimed, db, job_id, token, {"total_sections": len(outline)}):
+                return
+
+            events = ai_service.iter_sections(
+                topic=topic,
+                outline=outline,
+                doc_type=doc_type,
+                mode=mode,
+                completed={i: s["content"] for i, s in finished.items()}
+            )
+            try:
+                async for event in events:
+                    section = event["section"]
+                    finished[section["index"]] = section
+                    owned = await asyncio.to_thread(self._update_claimed, db, job_id, token, {
+                        "sections": {str(i): section for i, section in finished.items()},
+                        "completed_sections": len(finished)
+                    })
+                    if not owned:
+                        print(f"Generation job {job_id} was taken over by another worker")
+                        return
+            except asyncio.CancelledError:
+                await asyncio.to_thread(self._update_claimed, db, job_id, token, {"status": "queued", "claim_token": None})
+                raise
+            except Exception as e:
+                print(f"Error running generation job {job_id}: {e}")
+                await asyncio.to_thread(self._update_claimed, db, job_id, token, {
+                    "status": "failed",
+                    "error": str(e),
+                    "claim_token": None
+                })
+                return
+            finally:
+                # Stop sections still being written when the loop ends early
+                await events.aclose()
+
+            def complete() -> bool:
+                if not self._update_claimed(db, job_id, token, {"status": "completed", "claim_token": None}, commit=False):
+                    db.rollback()
+                    return False
+                section_service.replace_sections(db, project_id, [finished[i] for i in sorted(finished)])
+                db.commit()
+                return True
+
+            if not await asyncio.to_thread(complete):
+                return
+        finally:
+            db.close()
+        
+        if EXPORT_PRERENDER:
+            await asyncio.to_thread(export_cache.prerender_project, project_id)
+
+
+# Global job service instance
+job_service = JobService()
@@ -0,0 +1,237 @@
+"""
+Prometheus metrics
+
+Request, model call, export render and database query latencies, cache
+lookups and in-flight gauges, served at /metrics in the Prometheus text
+format.
+
+Each gunicorn worker keeps its own values. Point PROMETHEUS_MULTIPROC_DIR
+at a directory that is empty when the server starts and every worker
+writes its values there instead; /metrics then aggregates all workers, so
+it does not matter which worker answers the scrape. gunicorn.conf.py
+clears the directory on start and drops the gauges of workers that exit.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# config loads .env, which must happen before prometheus_client reads
+# PROMETHEUS_MULTIPROC_DIR on import
+from config import PROMETHEUS_MULTIPROC_DIR
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+# Model calls and renders take far longer than API requests or queries
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of the response",
+    ["method", "route", "status"],
+    buckets=FAST_BUCKETS
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled (including open streams)",
+    multiprocess_mode="livesum"
+)
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds",
+    "Model call latency (cache hits are not model calls)",
+    ["operation", "outcome"],
+    buckets=SLOW_BUCKETS
+)
+llm_requests_in_flight = Gauge(
+    "llm_requests_in_flight",
+    "Model calls waiting on a response",
+    ["operation"],
+    multiprocess_mode="livesum"
+)
+llm_prompt_tokens = Histogram(
+    "llm_prompt_tokens",
+    "Estimated prompt size of model calls",
+    ["operation"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+)
+llm_retries = Counter(
+    "llm_retries_total",
+    "Model call attempts retried after a transient failure",
+    ["operation"]
+)
+llm_hedged_requests = Counter(
+    "llm_hedged_requests_total",
+    "Duplicate model requests sent because the first was slower than p95",
+    ["operation"]
+)
+llm_circuit_open = Gauge(
+    "llm_circuit_open",
+    "1 while the model circuit breaker is failing calls fast",
+    multiprocess_mode="livemax"
+)
+llm_queue_wait = Histogram(
+    "llm_queue_wait_seconds",
+    "Time a model call waits for a slot and rate limit room",
+    ["priority"],
+    buckets=FAST_BUCKETS + (30, 60)
+)
+export_render_duration = Histogram(
+    "export_render_duration_seconds",
+    "Export render time, including any wait for a render worker",
+    ["format"],
+    buckets=SLOW_BUCKETS
+)
+export_renders_in_flight = Gauge(
+    "export_renders_in_flight",
+    "Exports rendering or waiting for a render worker",
+    multiprocess_mode="livesum"
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time",
+    ["operation"],
+    buckets=FAST_BUCKETS
+)
+cache_lookups = Counter(
+    "cache_lookups_total",
+    "Cache lookups by cache and result (hit ratio = hits / all lookups)",
+    ["cache", "result"]
+)
+coalesced_requests = Counter(
+    "coalesced_requests_total",
+    "Calls that joined an identical call already in flight instead of starting their own",
+    ["operation"]
+)
+idempotent_replays = Counter(
+    "idempotent_replays_total",
+    "Requests answered with the stored response of an earlier request with the same Idempotency-Key",
+    ["operation"]
+)
+
+# Statement keywords reported as their own db_query_duration operation
+DB_OPERATIONS = {"select", "insert", "update", "delete"}
+
+
+@contextmanager
+def track_llm_call(operation: str) -> Iterator[None]:
+    """
+    Time a model call and count it as in flight while it runs
+
+    Args:
+        operation: "outline", "section", "refine" or "summary"
+    """
+    in_flight = llm_requests_in_flight.labels(operation)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        llm_request_duration.labels(operation, outcome).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+@contextmanager
+def track_export_render(doc_type: str) -> Iterator[None]:
+    """Time an export render and count it as in flight while it runs"""
+    export_renders_in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        export_render_duration.labels(doc_type).observe(time.perf_counter() - start)
+        export_renders_in_flight.dec()
+
+
+def record_cache_lookup(cache: str, result: str):
+    """
+    Count a cache lookup
+
+    Args:
+        cache: Which cache ("llm", "export" or "principal")
+        result: "hit", "miss", or "disk_hit" for the shared LLM cache tier
+    """
+    cache_lookups.labels(cache, result).inc()
+
+
+def statement_operation(statement: str) -> str:
+    """Label a SQL statement by its leading keyword"""
+    keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return keyword if keyword in DB_OPERATIONS else "other"
+
+
+def render_latest() -> bytes:
+    """Current metrics in the Prometheus text format, across workers in multi-process mode"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template
+
+    Latency runs until the last body chunk is sent, so streamed (SSE)
+    responses are timed to the end of the stream. Routes are labelled by
+    their path template (/api/projects/{project_id}), never the raw path.
+    """
+
+    def __init__(self, app):
+        """
+        Initialize the middleware
+
+        Args:
+            app: The ASGI app being wrapped
+        """
+        self.app = app
+        self._route_paths: Optional[Dict] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_duration.labels(
+                scope["method"], self._route_label(scope), str(status["code"])
+            ).observe(time.perf_counter() - start)
+
+    def _route_label(self, scope) -> str:
+        """Path template of the route that handled the request"""
+        # The router records the matched endpoint in the shared scope
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(route, "endpoint", None) or getattr(route, "app", None): route.path or "/"
+                for route in scope["app"].routes
+            }
+        return self._route_paths.get(endpoint, "unmatched")
@@ -0,0 +1,111 @@
+"""
+Process pool for password hashing
+
+bcrypt spends a few hundred milliseconds of CPU per hash or verification.
+Running it in worker processes keeps it off the event loop, the GIL and the
+threadpool that sync routes share. The number of hashes waiting on the pool
+is capped; past the cap callers get PasswordPoolSaturated and the API
+answers 503 with Retry-After, so a login storm queues outside the server
+instead of inside it.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple
+
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+from services.auth import get_password_hash, verify_and_update_password, warm_password_worker
+
+
+class PasswordPoolSaturated(Exception):
+    """Raised when too many password hashes are already waiting"""
+
+
+class PasswordPool:
+    """Bounded process pool for bcrypt hashing and verification"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        """
+        Initialize the pool
+
+        Args:
+            workers: Worker processes (0 hashes in a thread)
+            max_pending: Hashes allowed in flight or waiting before rejecting
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Start the worker processes and load bcrypt in each"""
+        if self.workers <= 0:
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(warm_password_worker) for _ in range(self.workers)]:
+            future.result()
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password in a worker process
+
+        Raises:
+            PasswordPoolSaturated: If max_pending hashes are already queued
+        """
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password in a worker process
+
+        Returns:
+            Tuple of (valid, new hash if the stored one uses an outdated cost factor)
+
+        Raises:
+            PasswordPoolSaturated: If max_pending hashes are already queued
+        """
+        return await self._run(verify_and_update_password, password, hashed_password)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, func: Callable, *args):
+        """Run func in the pool, rejecting the call if the pool is full"""
+        # Only the event loop touches pending, so no lock is needed
+        if self.pending >= self.max_pending:
+            raise PasswordPoolSaturated()
+        self.pending += 1
+        try:
+            if self.workers <= 0:
+                return await asyncio.to_thread(func, *args)
+
+            executor = self._get_executor()
+            try:
+                return await asyncio.wrap_future(executor.submit(func, *args))
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool for the next call
+                if self._executor is executor:
+                    self._executor = None
+                raise
+        finally:
+            self.pending -= 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the executor on first use"""
+        if self._executor is None:
+            # By now the process runs the scheduler, metrics and database
+            # threads; forking it could copy a lock another thread holds
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_password_worker
+            )
+        return self._executor
+
+
+# Global password pool instance
+password_pool = PasswordPool()
@@ -0,0 +1,88 @@
+"""
+In-process cache of authenticated principals
+
+Authenticated routes resolve the bearer token to a Principal (user id and
+username) instead of loading the full User row. Resolved tokens are cached
+for a short TTL, so repeat requests with the same token skip both the JWT
+decode and the user lookup. Entries are dropped when the user row changes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from config import PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES
+from services.metrics import record_cache_lookup
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as far as most handlers need it"""
+    id: int
+    username: str
+
+
+class PrincipalCache:
+    """Bounded TTL cache of bearer token -> Principal"""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES, ttl_seconds: int = PRINCIPAL_CACHE_TTL_SECONDS):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum tokens kept (least recently used are evicted)
+            ttl_seconds: How long a resolved token is trusted without a lookup
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        """Return the cached principal for a token, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[token]
+                entry = None
+            if entry is None:
+                record_cache_lookup("principal", "miss")
+                return None
+            self._entries.move_to_end(token)
+        record_cache_lookup("principal", "hit")
+        return entry[0]
+
+    def set(self, token: str, principal: Principal, token_expires_at: float):
+        """
+        Cache a resolved token
+
+        Args:
+            token: Bearer token
+            principal: Principal the token resolved to
+            token_expires_at: The token's own expiry; entries never outlive it
+        """
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = min(time.time() + self.ttl_seconds, token_expires_at)
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of a user"""
+        with self._lock:
+            stale = [token for token, (principal, _) in self._entries.items() if principal.id == user_id]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+
+# Global principal cache instance
+principal_cache = PrincipalCache()
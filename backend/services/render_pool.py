@@ -0,0 +1,102 @@
+"""
+Process pool for rendering exports
+
+Building the document XML and compressing the zip is CPU-bound, so it runs
+in worker processes outside the web worker's GIL. The number of renders
+waiting on the pool is capped; past the cap callers get RenderPoolSaturated
+and the API answers 503 with Retry-After instead of queueing without bound.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from config import EXPORT_RENDER_WORKERS, EXPORT_RENDER_MAX_PENDING
+from services.export_service import render_export_file, warm_render_worker
+from services.metrics import track_export_render
+
+
+class RenderPoolSaturated(Exception):
+    """Raised when too many exports are already waiting to render"""
+
+
+class RenderPool:
+    """Bounded process pool for export rendering"""
+
+    def __init__(self, workers: int = EXPORT_RENDER_WORKERS, max_pending: int = EXPORT_RENDER_MAX_PENDING):
+        """
+        Initialize the pool
+
+        Args:
+            workers: Worker processes (0 renders in the calling thread)
+            max_pending: Renders allowed in flight or waiting before rejecting
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes and import the document libraries in each"""
+        if self.workers <= 0:
+            return
+        with self._lock:
+            executor = self._get_executor()
+        for future in [executor.submit(warm_render_worker) for _ in range(self.workers)]:
+            future.result()
+
+    def render_to_file(self, doc_type: str, topic: str, sections: List[Dict], path: str):
+        """
+        Render an export to a file in a worker process, waiting for it to finish
+
+        Raises:
+            RenderPoolSaturated: If max_pending renders are already queued
+        """
+        if self.workers <= 0:
+            with track_export_render(doc_type):
+                render_export_file(doc_type, topic, sections, path)
+            return
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise RenderPoolSaturated()
+            self.pending += 1
+            executor = self._get_executor()
+
+        try:
+            with track_export_render(doc_type):
+                executor.submit(render_export_file, doc_type, topic, sections, path).result()
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next render
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the executor on first use (the caller holds the lock)"""
+        if self._executor is None:
+            # By now the process runs the scheduler, metrics and database
+            # threads; forking it could copy a lock another thread holds
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_render_worker
+            )
+        return self._executor
+
+
+# Global render pool instance
+render_pool = RenderPool()
@@ -0,0 +1,126 @@
+"""
+Section storage service for generated project content
+
+Generated content is stored one row per section/slide, so edits to a single
+section read and write only that row.
+"""
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models.models import Project, Section
+
+
+SECTION_FIELDS = ("title", "content", "feedback", "comment", "note")
+
+
+class SectionService:
+    """Service for reading and writing generated sections"""
+
+    @staticmethod
+    def get_sections(db: Session, project_id: int) -> List[Dict[str, Any]]:
+        """
+        Load all sections of a project
+
+        Args:
+            db: Database session
+            project_id: Project whose sections to load
+
+        Returns:
+            List of section dicts in outline order
+        """
+        sections = db.query(Section).filter(
+            Section.project_id == project_id
+        ).order_by(Section.index).all()
+        return [section.to_dict() for section in sections]
+
+    @staticmethod
+    def get_section(db: Session, project_id: int, index: int) -> Optional[Section]:
+        """Load a single section by its position"""
+        return db.query(Section).filter(
+            Section.project_id == project_id,
+            Section.index == index
+        ).first()
+
+    @staticmethod
+    def get_sections_at(db: Session, project_id: int, indices: Optional[List[int]] = None) -> List[Section]:
+        """
+        Load several sections by position in one query
+
+        Args:
+            db: Database session
+            project_id: Project whose sections to load
+            indices: Positions to load (all sections when None)
+
+        Returns:
+            Section rows in outline order; missing positions are left out
+        """
+        query = db.query(Section).filter(Section.project_id == project_id)
+        if indices is not None:
+            query = query.filter(Section.index.in_(indices))
+        return query.order_by(Section.index).all()
+
+    @staticmethod
+    def save_section(db: Session, project_id: int, data: Dict[str, Any]) -> Section:
+        """
+        Insert or update the section at data['index']
+
+        Only fields present in data are written. The caller commits.
+        """
+        section = SectionService.get_section(db, project_id, data["index"])
+        if section is None:
+            section = Section(project_id=project_id, index=data["index"])
+            db.add(section)
+
+        for key in SECTION_FIELDS:
+            if key in data:
+                setattr(section, key, data[key])
+        return section
+
+    @staticmethod
+    def replace_sections(db: Session, project_id: int, sections: List[Dict[str, Any]]):
+        """
+        Replace all sections of a project
+
+        Existing rows are updated in place (unchanged rows are not written)
+        and rows beyond the new length are deleted. The caller commits.
+
+        Args:
+            db: Database session
+            project_id: Project whose sections to replace
+            sections: List of section dicts in outline order
+        """
+        existing = {
+            section.index: section
+            for section in db.query(Section).filter(Section.project_id == project_id)
+        }
+
+        for i, data in enumerate(sections):
+            section = existing.pop(i, None)
+            if section is None:
+                section = Section(project_id=project_id, index=i)
+                db.add(section)
+            for key in SECTION_FIELDS:
+                setattr(section, key, data.get(key))
+
+        for section in existing.values():
+            db.delete(section)
+
+        SectionService.touch_project(db, project_id)
+
+    @staticmethod
+    def touch_project(db: Session, project_id: int):
+        """
+        Bump the project's updated_at after its sections change
+
+        Section rows live outside the projects table, so edits to them do
+        not trigger Project.updated_at's onupdate. The caller commits.
+        """
+        db.query(Project).filter(Project.id == project_id).update(
+            {"updated_at": datetime.utcnow()},
+            synchronize_session=False
+        )
+
+
+# Global section service instance
+section_service = SectionService()
@@ -0,0 +1,62 @@
+"""
+Single-flight coalescing of identical in-flight work
+
+When several callers ask for the same thing at once (a double-clicked
+generate, two tabs suggesting an outline for the same topic), the first
+caller starts the work and the others wait for its result instead of
+paying for it again. Nothing is kept once the work finishes; repeat calls
+after that are up to the response cache or the idempotency store.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from services.metrics import coalesced_requests
+
+
+class SingleFlight:
+    """Shares one in-flight task between concurrent calls with the same key"""
+
+    def __init__(self, name: str):
+        """
+        Initialize the group
+
+        Args:
+            name: Metrics label for calls coalesced by this group
+        """
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run work(), or join the call already running for key
+
+        The work runs in its own task, so it finishes (and e.g. saves its
+        result) even if the caller that started it goes away.
+
+        Args:
+            key: Identifies identical calls
+            work: Starts the work; only called when nothing is in flight
+
+        Returns:
+            The work's result (its exception is raised to every caller)
+        """
+        task = self._calls.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(work())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            coalesced_requests.labels(self.name).inc()
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Calls currently running"""
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        """Drop a finished call (unless a newer one took its key)"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every caller went away
+            task.exception()
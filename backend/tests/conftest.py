@@ -0,0 +1,60 @@
+"""
+Shared test setup
+
+Tests run against a throwaway SQLite database and export cache, with the
+AI model disabled (placeholder content) unless a test swaps the backend.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="ai-docs-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp, "app.db")
+os.environ["EXPORT_CACHE_DIR"] = os.path.join(_tmp, "exports")
+os.environ["GEMINI_API_KEY"] = ""
+os.environ["LLM_RATE_LIMIT_DB_PATH"] = ""
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ["JOB_WORKERS"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client for the app, with startup and shutdown run once"""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Authorization headers for a newly registered user"""
+    username = "user-" + uuid.uuid4().hex[:12]
+    response = client.post("/api/auth/register", json={
+        "email": f"{username}@example.com",
+        "username": username,
+        "password": "password"
+    })
+    assert response.status_code == 201, response.text
+    response = client.post("/api/auth/login", data={"username": username, "password": "password"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+
+@pytest.fixture
+def project(client, auth_headers):
+    """A Word project with a three-section outline, returned as JSON"""
+    response = client.post("/api/projects/", json={
+        "type": "docx",
+        "topic": "Testing",
+        "outline": ["Introduction", "Details", "Conclusion"]
+    }, headers=auth_headers)
+    assert response.status_code in (200, 201), response.text
+    return response.json()
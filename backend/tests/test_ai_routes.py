@@ -0,0 +1,47 @@
+"""
+Tests for the AI generation routes
+"""
+import pytest
+
+from ai.ai_service import ai_service
+from ai.backends import LLMBackend, LLMError
+from ai.resilience import CircuitBreaker, ResilientCaller
+
+
+class DownBackend(LLMBackend):
+    """A backend whose upstream is always failing"""
+
+    model_name = "down"
+
+    async def generate(self, prompt: str) -> str:
+        raise LLMError("upstream down")
+
+    async def stream(self, prompt: str):
+        raise LLMError("upstream down")
+        yield
+
+
+@pytest.fixture
+def model_down(monkeypatch):
+    """Make every model call fail without retries"""
+    monkeypatch.setattr(ai_service, "backend", DownBackend())
+    monkeypatch.setattr(ai_service, "enabled", True)
+    monkeypatch.setattr(ai_service, "cache", None)
+    monkeypatch.setattr(ai_service, "resilience", ResilientCaller(
+        attempts=1, base_delay_ms=0, max_delay_ms=0, hedge=False,
+        breaker=CircuitBreaker(failure_threshold=0)
+    ))
+
+
+def test_suggest_outline_returns_503_when_model_is_down(client, auth_headers, model_down):
+    response = client.post("/api/ai/suggest-outline", json={"topic": "Testing", "type": "docx"}, headers=auth_headers)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_generate_returns_503_and_saves_nothing_when_model_is_down(client, auth_headers, project, model_down):
+    response = client.post("/api/ai/generate", json={"project_id": project["id"]}, headers=auth_headers)
+    assert response.status_code == 503
+
+    response = client.get(f"/api/projects/{project['id']}", headers=auth_headers)
+    assert response.json()["generated_content"] is None
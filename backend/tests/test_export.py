@@ -0,0 +1,89 @@
+"""
+Tests for the export routes
+"""
+import io
+import zipfile
+
+import routes.export
+import services.export_cache
+from routes.export import _etag_matches, _safe_filename
+from services.export_cache import export_cache
+from services.render_pool import RenderPoolSaturated
+
+
+def create_generated_project(client, headers, topic: str, doc_type: str = "docx") -> int:
+    """Create a project and generate its (placeholder) content"""
+    response = client.post("/api/projects/", json={
+        "type": doc_type, "topic": topic, "outline": ["One", "Two"]
+    }, headers=headers)
+    project_id = response.json()["id"]
+    response = client.post("/api/ai/generate", json={"project_id": project_id}, headers=headers)
+    assert response.status_code == 200, response.text
+    return project_id
+
+
+def test_safe_filename():
+    assert _safe_filename("Market plan 2024") == "Market_plan_2024"
+    assert _safe_filename("../../etc/passwd") == "etc_passwd"
+    assert _safe_filename("a\\\\b/c") == "a_b_c"
+    assert _safe_filename("..") == "project"
+    assert _safe_filename('x"; y\r\n') == "x_y"
+
+
+def test_bulk_export_entry_names_stay_flat(client, auth_headers):
+    ids = [
+        create_generated_project(client, auth_headers, "../../evil"),
+        create_generated_project(client, auth_headers, "a/b\\c", "pptx")
+    ]
+    response = client.post("/api/export/bulk", json={"project_ids": ids}, headers=auth_headers)
+    assert response.status_code == 200
+
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert sorted(names) == sorted([f"{ids[0]}_evil.docx", f"{ids[1]}_a_b_c.pptx"])
+
+
+def test_bulk_export_gives_up_when_render_pool_stays_full(client, auth_headers, monkeypatch):
+    project_id = create_generated_project(client, auth_headers, "Busy")
+
+    def render(key, doc_type, topic, sections):
+        raise RenderPoolSaturated()
+
+    monkeypatch.setattr(export_cache, "render", render)
+    monkeypatch.setattr(routes.export, "EXPORT_BULK_RENDER_TIMEOUT_SECONDS", 0.1)
+    response = client.post("/api/export/bulk", json={"project_ids": [project_id]}, headers=auth_headers)
+    assert response.status_code == 200
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.namelist() == [f"{project_id}_Busy.docx.error.txt"]
+    assert b"render pool stayed full" in archive.read(archive.namelist()[0])
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert _etag_matches('"abc"', etag)
+    assert _etag_matches('W/"abc"', etag)
+    assert _etag_matches('"x", "abc"', etag)
+    assert _etag_matches("*", etag)
+    assert not _etag_matches('"abcd"', etag)
+    assert not _etag_matches('"ab"', etag)
+    assert not _etag_matches("", etag)
+
+
+def test_export_revalidates_with_etag(client, auth_headers):
+    project_id = create_generated_project(client, auth_headers, "Caching")
+    response = client.get(f"/api/export/docx/{project_id}", headers=auth_headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/api/export/docx/{project_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_export_cache_key_depends_on_renderer(monkeypatch):
+    sections = [{"title": "One", "content": "Text"}]
+    standard = export_cache.make_key("docx", "Topic", sections)
+    assert export_cache.make_key("docx", "Topic", sections) == standard
+    assert export_cache.make_key("pptx", "Topic", sections) != standard
+
+    monkeypatch.setattr(services.export_cache, "EXPORT_RENDERER", "fast-1/python-docx-1.1.0/python-pptx-0.6.23")
+    assert export_cache.make_key("docx", "Topic", sections) != standard
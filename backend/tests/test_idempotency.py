@@ -0,0 +1,78 @@
+"""
+Tests for Idempotency-Key handling on generate and refine
+"""
+import uuid
+
+from ai.ai_service import ai_service
+from ai.resilience import ModelUnavailable
+
+
+def key() -> str:
+    return uuid.uuid4().hex
+
+
+def test_repeat_request_replays_stored_response(client, auth_headers, project, monkeypatch):
+    headers = {**auth_headers, "Idempotency-Key": key()}
+    body = {"project_id": project["id"]}
+    first = client.post("/api/ai/generate", json=body, headers=headers)
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    async def generate_sections(**kwargs):
+        raise AssertionError("a replayed request must not generate again")
+
+    monkeypatch.setattr(ai_service, "generate_sections", generate_sections)
+    second = client.post("/api/ai/generate", json=body, headers=headers)
+    assert second.status_code == 200
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json() == first.json()
+
+
+def test_keys_are_scoped_to_the_user(client, auth_headers, project):
+    shared = key()
+    response = client.post("/api/ai/generate", json={"project_id": project["id"]},
+                           headers={**auth_headers, "Idempotency-Key": shared})
+    assert response.status_code == 200
+
+    # Someone else's project id under the same key is a new request for them: 404, not a replay
+    username = "other-" + uuid.uuid4().hex[:8]
+    client.post("/api/auth/register", json={
+        "email": f"{username}@example.com", "username": username, "password": "password"
+    })
+    token = client.post("/api/auth/login", data={"username": username, "password": "password"}).json()["access_token"]
+    response = client.post("/api/ai/generate", json={"project_id": project["id"]},
+                           headers={"Authorization": f"Bearer {token}", "Idempotency-Key": shared})
+    assert response.status_code == 404
+
+
+def test_key_reused_for_different_request_is_rejected(client, auth_headers, project):
+    headers = {**auth_headers, "Idempotency-Key": key()}
+    assert client.post("/api/ai/generate", json={"project_id": project["id"]}, headers=headers).status_code == 200
+
+    response = client.post("/api/ai/generate", json={"project_id": project["id"], "mode": "concurrent"}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_malformed_key_is_rejected(client, auth_headers, project):
+    response = client.post("/api/ai/generate", json={"project_id": project["id"]},
+                           headers={**auth_headers, "Idempotency-Key": "x" * 256})
+    assert response.status_code == 400
+
+
+def test_failed_request_releases_its_key(client, auth_headers, project, monkeypatch):
+    assert client.post("/api/ai/generate", json={"project_id": project["id"]}, headers=auth_headers).status_code == 200
+    headers = {**auth_headers, "Idempotency-Key": key()}
+
+    body = {"project_id": project["id"], "section_index": 0, "refinement_prompt": "shorter"}
+
+    async def unavailable(original_content, refinement_prompt, section_title):
+        raise ModelUnavailable("model down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ai_service, "refine_content", unavailable)
+        assert client.post("/api/ai/refine", json=body, headers=headers).status_code == 503
+
+    # The retry with the same key runs the request rather than replaying the failure
+    response = client.post("/api/ai/refine", json=body, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
@@ -0,0 +1,79 @@
+"""
+Tests for background generation jobs
+"""
+import asyncio
+import uuid
+
+from sqlalchemy import text
+
+from database.db import SessionLocal
+from models.models import GenerationJob, Section
+from services.job_service import job_service
+
+
+def queue_job(client, headers, project_id: int) -> int:
+    response = client.post("/api/ai/generate", json={"project_id": project_id, "background": True}, headers=headers)
+    assert response.status_code == 202, response.text
+    return response.json()["job"]["id"]
+
+
+def claim(job_id: int) -> str:
+    """Claim a specific job the way _claim_next does"""
+    token = uuid.uuid4().hex
+    with SessionLocal() as db:
+        db.query(GenerationJob).filter(GenerationJob.id == job_id).update(
+            {"status": "running", "claim_token": token}, synchronize_session=False
+        )
+        db.commit()
+    return token
+
+
+def load(job_id: int) -> GenerationJob:
+    with SessionLocal() as db:
+        return db.get(GenerationJob, job_id)
+
+
+def section_count(project_id: int) -> int:
+    with SessionLocal() as db:
+        return db.query(Section).filter(Section.project_id == project_id).count()
+
+
+def test_job_generates_and_saves_sections(client, auth_headers, project):
+    job_id = queue_job(client, auth_headers, project["id"])
+    asyncio.run(job_service.run(job_id, claim(job_id)))
+
+    job = load(job_id)
+    assert job.status == "completed"
+    assert job.claim_token is None
+    assert job.completed_sections == 3
+    assert section_count(project["id"]) == 3
+
+
+def test_job_that_lost_its_claim_writes_nothing(client, auth_headers, project):
+    job_id = queue_job(client, auth_headers, project["id"])
+    token = claim(job_id)
+    # Another worker took the job over
+    other = claim(job_id)
+
+    asyncio.run(job_service.run(job_id, token))
+
+    job = load(job_id)
+    assert job.status == "running"
+    assert job.claim_token == other
+    assert job.completed_sections == 0
+    assert section_count(project["id"]) == 0
+
+
+def test_job_for_deleted_project_fails(client, auth_headers, project):
+    job_id = queue_job(client, auth_headers, project["id"])
+    token = claim(job_id)
+    with SessionLocal() as db:
+        db.execute(text("DELETE FROM projects WHERE id = :id"), {"id": project["id"]})
+        db.commit()
+
+    asyncio.run(job_service.run(job_id, token))
+
+    job = load(job_id)
+    assert job.status == "failed"
+    assert job.error == "Project was deleted"
+    assert job.claim_token is None
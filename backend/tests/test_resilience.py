@@ -0,0 +1,184 @@
+"""
+Tests for the circuit breaker and retrying model caller
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from ai.backends import LLMError
+from ai.resilience import CircuitBreaker, ModelUnavailable, ResilientCaller
+
+
+@asynccontextmanager
+async def no_slot():
+    """Admit every attempt at once"""
+    yield
+
+
+def make_caller(threshold: int = 2, reset_seconds: float = 0.0, attempts: int = 1) -> ResilientCaller:
+    """A caller without backoff delays whose breaker opens quickly"""
+    return ResilientCaller(
+        attempts=attempts,
+        base_delay_ms=0,
+        max_delay_ms=0,
+        attempt_timeout=5,
+        deadline=5,
+        hedge=False,
+        breaker=CircuitBreaker(failure_threshold=threshold, reset_seconds=reset_seconds)
+    )
+
+
+async def failing() -> str:
+    raise LLMError("upstream down")
+
+
+async def answering() -> str:
+    return "ok"
+
+
+async def open_breaker(caller: ResilientCaller):
+    """Fail calls until the breaker opens"""
+    for _ in range(caller.breaker.failure_threshold):
+        with pytest.raises(ModelUnavailable):
+            await caller.call("test", failing, no_slot)
+    assert caller.breaker.opened_at is not None
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    async def scenario():
+        caller = make_caller(reset_seconds=60)
+        await open_breaker(caller)
+        calls = []
+
+        async def attempt() -> str:
+            calls.append(1)
+            return "ok"
+
+        with pytest.raises(ModelUnavailable) as error:
+            await caller.call("test", attempt, no_slot)
+        assert calls == []
+        assert error.value.retry_after >= 1
+
+    asyncio.run(scenario())
+
+
+def test_half_open_probe_success_closes_breaker():
+    async def scenario():
+        caller = make_caller()
+        await open_breaker(caller)
+        assert await caller.call("test", answering, no_slot) == "ok"
+        assert caller.breaker.opened_at is None
+        assert caller.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_half_open_probe_failure_reopens_breaker():
+    async def scenario():
+        caller = make_caller(reset_seconds=0.05)
+        await open_breaker(caller)
+        await asyncio.sleep(0.06)
+        with pytest.raises(ModelUnavailable):
+            await caller.call("test", failing, no_slot)
+        # Reopened: the next call fails fast without a probe
+        assert caller.breaker.opened_at is not None
+        with pytest.raises(ModelUnavailable, match="temporarily unavailable"):
+            await caller.call("test", answering, no_slot)
+
+    asyncio.run(scenario())
+
+
+def test_only_one_probe_at_a_time():
+    async def scenario():
+        caller = make_caller()
+        await open_breaker(caller)
+        release = asyncio.Event()
+
+        async def slow() -> str:
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.create_task(caller.call("test", slow, no_slot))
+        await asyncio.sleep(0)
+        with pytest.raises(ModelUnavailable, match="temporarily unavailable"):
+            await caller.call("test", answering, no_slot)
+        release.set()
+        assert await probe == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_releases_breaker():
+    async def scenario():
+        caller = make_caller()
+        await open_breaker(caller)
+
+        async def hanging() -> str:
+            await asyncio.Event().wait()
+            return "never"
+
+        probe = asyncio.create_task(caller.call("test", hanging, no_slot))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The next call gets to probe, and its success closes the breaker
+        assert await caller.call("test", answering, no_slot) == "ok"
+        assert caller.breaker.opened_at is None
+
+    asyncio.run(scenario())
+
+
+def test_closed_stream_probe_releases_breaker():
+    async def scenario():
+        caller = make_caller()
+        await open_breaker(caller)
+
+        async def chunks():
+            for chunk in ("a", "b", "c"):
+                yield chunk
+
+        stream = caller.stream("test", chunks, no_slot)
+        assert await stream.__anext__() == "a"
+        # The client went away mid-stream
+        await stream.aclose()
+
+        assert [chunk async for chunk in caller.stream("test", chunks, no_slot)] == ["a", "b", "c"]
+        assert caller.breaker.opened_at is None
+
+    asyncio.run(scenario())
+
+
+def test_transient_failures_are_retried():
+    async def scenario():
+        caller = make_caller(threshold=10, attempts=3)
+        results = iter([LLMError("busy"), LLMError("busy"), "ok"])
+
+        async def flaky() -> str:
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        assert await caller.call("test", flaky, no_slot) == "ok"
+        assert caller.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_non_transient_error_is_not_retried():
+    async def scenario():
+        caller = make_caller(attempts=3)
+        calls = []
+
+        async def broken() -> str:
+            calls.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ModelUnavailable):
+            await caller.call("test", broken, no_slot)
+        assert calls == [1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,165 @@
+"""
+Tests for the model call scheduler and rate limiter
+"""
+import asyncio
+import os
+import tempfile
+from typing import Optional
+
+from ai.scheduler import BULK, INTERACTIVE, LLMScheduler, RateLimiter, llm_caller
+
+
+class RecordingLimiter:
+    """Limiter that never makes calls wait and records what it charged"""
+
+    enabled = True
+
+    def __init__(self):
+        self.acquired = 0
+        self.refunded = 0
+        self.gate: Optional[asyncio.Event] = None
+
+    async def acquire(self, tokens: int, priority: int) -> float:
+        self.acquired += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return 0.0
+
+    async def refund(self, tokens: int):
+        self.refunded += 1
+
+
+async def call(scheduler: LLMScheduler, order: list, name: str, user: int, operation: str = "section"):
+    """Make a call as `user` and record when it got its turn"""
+    llm_caller.set(user)
+    async with scheduler.slot(operation, "prompt"):
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+async def hold(scheduler: LLMScheduler, release: asyncio.Event):
+    """Take the only slot until released"""
+    llm_caller.set(0)
+    async with scheduler.slot("section", "prompt"):
+        await release.wait()
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_users_take_turns():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, limiter=RecordingLimiter())
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, release))
+        await settle()
+
+        order = []
+        tasks = [asyncio.create_task(call(scheduler, order, name, user)) for name, user in
+                 [("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2)]]
+        await settle()
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        assert order == ["a1", "b1", "a2", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_interactive_calls_go_first():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, limiter=RecordingLimiter())
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, release))
+        await settle()
+
+        order = []
+        tasks = [
+            asyncio.create_task(call(scheduler, order, "section", 1, "section")),
+            asyncio.create_task(call(scheduler, order, "refine", 2, "refine"))
+        ]
+        await settle()
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        assert order == ["refine", "section"]
+
+    asyncio.run(scenario())
+
+
+def test_call_cancelled_before_its_turn_is_not_charged():
+    async def scenario():
+        limiter = RecordingLimiter()
+        scheduler = LLMScheduler(max_concurrency=1, limiter=limiter)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, release))
+        await settle()
+
+        waiting = asyncio.create_task(call(scheduler, [], "gone", 1))
+        await settle()
+        waiting.cancel()
+        await settle()
+        release.set()
+        await holder
+        await settle()
+
+        assert limiter.acquired == 1
+        assert scheduler.queued() == 0
+        assert scheduler.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_call_cancelled_while_rate_limit_is_checked_is_refunded():
+    async def scenario():
+        limiter = RecordingLimiter()
+        limiter.gate = asyncio.Event()
+        scheduler = LLMScheduler(max_concurrency=1, limiter=limiter)
+
+        waiting = asyncio.create_task(call(scheduler, [], "gone", 1))
+        await settle()
+        assert limiter.acquired == 1
+        waiting.cancel()
+        await settle()
+        limiter.gate.set()
+        await settle()
+
+        assert limiter.refunded == 1
+        assert scheduler.active == 0
+        assert scheduler.queued() == 0
+
+    asyncio.run(scenario())
+
+
+def test_rate_limiter_waits_when_bucket_is_empty():
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=0, interactive_reserve=0, db_path="")
+        assert await limiter.acquire(10, INTERACTIVE) == 0
+        assert await limiter.acquire(10, INTERACTIVE) == 0
+        assert await limiter.acquire(10, INTERACTIVE) > 0
+
+    asyncio.run(scenario())
+
+
+def test_bulk_calls_leave_the_interactive_reserve():
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=4, tokens_per_minute=0, interactive_reserve=0.5, db_path="")
+        assert await limiter.acquire(10, BULK) == 0
+        assert await limiter.acquire(10, BULK) == 0
+        assert await limiter.acquire(10, BULK) > 0
+        assert await limiter.acquire(10, INTERACTIVE) == 0
+
+    asyncio.run(scenario())
+
+
+def test_refund_returns_what_acquire_took():
+    async def scenario(db_path: str):
+        limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=1000, interactive_reserve=0, db_path=db_path)
+        assert await limiter.acquire(100, INTERACTIVE) == 0
+        assert await limiter.acquire(100, INTERACTIVE) > 0
+        await limiter.refund(100)
+        assert await limiter.acquire(100, INTERACTIVE) == 0
+
+    asyncio.run(scenario(""))
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(os.path.join(directory, "rate_limit.db")))
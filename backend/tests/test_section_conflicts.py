@@ -0,0 +1,94 @@
+"""
+Tests that concurrent writes to the same sections end in 409, not 500
+
+Model-backed routes release their session while the model works, then
+write with the version they read. These tests make another writer commit
+in that window.
+"""
+import pytest
+
+from ai.ai_service import ai_service
+from database.db import SessionLocal
+from models.models import Section
+from services.section_service import SectionService, section_service
+
+
+def edit_section(project_id: int, index: int, content: str):
+    """Change a section from outside the request, as a concurrent edit would"""
+    with SessionLocal() as db:
+        section = section_service.get_section(db, project_id, index)
+        section.content = content
+        db.commit()
+
+
+@pytest.fixture
+def generated(client, auth_headers, project):
+    """The project after a first generation, so it has sections"""
+    response = client.post("/api/ai/generate", json={"project_id": project["id"]}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    return project
+
+
+def test_refine_returns_409_when_section_changed_during_model_call(client, auth_headers, generated, monkeypatch):
+    async def refine_content(original_content, refinement_prompt, section_title):
+        edit_section(generated["id"], 1, "edited elsewhere")
+        return "refined"
+
+    monkeypatch.setattr(ai_service, "refine_content", refine_content)
+    response = client.post("/api/ai/refine", json={
+        "project_id": generated["id"], "section_index": 1, "refinement_prompt": "shorter"
+    }, headers=auth_headers)
+    assert response.status_code == 409
+
+    # The concurrent edit is kept
+    response = client.get(f"/api/projects/{generated['id']}", headers=auth_headers)
+    assert response.json()["generated_content"][1]["content"] == "edited elsewhere"
+
+
+def test_refine_batch_returns_409_when_section_changed_during_model_call(client, auth_headers, generated, monkeypatch):
+    async def refine_content(original_content, refinement_prompt, section_title):
+        if section_title == "Conclusion":
+            edit_section(generated["id"], 2, "edited elsewhere")
+        return "refined"
+
+    monkeypatch.setattr(ai_service, "refine_content", refine_content)
+    response = client.post("/api/ai/refine/batch", json={
+        "project_id": generated["id"], "refinement_prompt": "shorter"
+    }, headers=auth_headers)
+    assert response.status_code == 409
+
+    # Nothing from the batch was saved
+    contents = [section["content"] for section in client.get(
+        f"/api/projects/{generated['id']}", headers=auth_headers
+    ).json()["generated_content"]]
+    assert "refined" not in contents
+
+
+def test_generate_returns_409_when_section_changed_before_save(client, auth_headers, generated, monkeypatch):
+    touch_project = SectionService.touch_project
+
+    def edit_then_touch(db, project_id):
+        # Another request commits between replace_sections' reload and the flush
+        edit_section(project_id, 0, "edited elsewhere")
+        touch_project(db, project_id)
+
+    # Make the regenerated section differ from the stored one, so it is written
+    edit_section(generated["id"], 0, "before")
+    monkeypatch.setattr(SectionService, "touch_project", staticmethod(edit_then_touch))
+    response = client.post("/api/ai/generate", json={"project_id": generated["id"]}, headers=auth_headers)
+    assert response.status_code == 409
+
+
+def test_generate_returns_409_when_sections_inserted_before_save(client, auth_headers, project, monkeypatch):
+    touch_project = SectionService.touch_project
+
+    def insert_then_touch(db, project_id):
+        # Another generation inserts the same sections first
+        with SessionLocal() as other:
+            other.add(Section(project_id=project_id, index=0, title="Introduction", content="other"))
+            other.commit()
+        touch_project(db, project_id)
+
+    monkeypatch.setattr(SectionService, "touch_project", staticmethod(insert_then_touch))
+    response = client.post("/api/ai/generate", json={"project_id": project["id"]}, headers=auth_headers)
+    assert response.status_code == 409
@@ -38,9 +38,17 @@ if (!token) {
 }
 
 // API Functions
-async function fetchProjects() {
+const PAGE_SIZE = 20;
+let nextCursor = null;
+
+async function fetchProjects(cursor = null) {
     try {
-        const response = await fetch(`${API_BASE_URL}/api/projects/`, {
+        const params = new URLSearchParams({ limit: PAGE_SIZE });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+
+        const response = await fetch(`${API_BASE_URL}/api/projects/summaries?${params}`, {
             headers: {
                 'Authorization': `Bearer ${token}`,
             },
@@ -122,11 +130,14 @@ async function getCurrentUser() {
 }
 
 // UI Functions
-function renderProjects(projects) {
+function renderProjects(projects, append = false) {
     const grid = document.getElementById('projects-grid');
     const emptyState = document.getElementById('empty-state');
+    const loadMore = document.getElementById('load-more');
 
-    if (projects.length === 0) {
+    loadMore.classList.toggle('hidden', !nextCursor);
+
+    if (projects.length === 0 && !append) {
         grid.classList.add('hidden');
         emptyState.classList.remove('hidden');
         return;
@@ -135,7 +146,7 @@ function renderProjects(projects) {
     grid.classList.remove('hidden');
     emptyState.classList.add('hidden');
 
-    grid.innerHTML = projects.map(project => `
+    const html = projects.map(project => `
         <div class="card project-card fade-in" onclick="openProject(${project.id})">
             <div class="project-card-actions">
                 <button onclick="event.stopPropagation(); confirmDelete(${project.id})" 
@@ -155,12 +166,18 @@ function renderProjects(projects) {
                 Created: ${new Date(project.created_at).toLocaleDateString()}
             </p>
             
-            ${project.generated_content ?
+            ${project.section_count > 0 ?
             '<p class="text-small" style="color: var(--success); margin-top: 0.5rem;">✓ Content Generated</p>' :
             '<p class="text-small text-muted" style="margin-top: 0.5rem;">⚠ Not yet generated</p>'
         }
         </div>
     `).join('');
+
+    if (append) {
+        grid.insertAdjacentHTML('beforeend', html);
+    } else {
+        grid.innerHTML = html;
+    }
 }
 
 function openProject(projectId) {
@@ -196,8 +213,9 @@ function hideNewProjectModal() {
 // Load Projects
 async function loadProjects() {
     try {
-        const projects = await fetchProjects();
-        renderProjects(projects);
+        const page = await fetchProjects();
+        nextCursor = page.next_cursor;
+        renderProjects(page.items);
     } catch (error) {
         showAlert(error.message, 'danger');
         if (error.message.includes('credentials')) {
@@ -206,6 +224,16 @@ async function loadProjects() {
     }
 }
 
+async function loadMoreProjects() {
+    try {
+        const page = await fetchProjects(nextCursor);
+        nextCursor = page.next_cursor;
+        renderProjects(page.items, true);
+    } catch (error) {
+        showAlert(error.message, 'danger');
+    }
+}
+
 // Load User Info
 async function loadUserInfo() {
     try {